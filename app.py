@@ -1,31 +1,95 @@
+import os
+import signal
+import socket
+import asyncio
+from multiprocessing import Process
 from sanic import Sanic
-from utils import LOGGING_CONFIG, logger
+from utils import LOGGING_CONFIG, logger, loop_lag
 import routes
 from conf import conf
-from services import http_request, redis_client
+from services import http_request, redis_client, content, ip_lang, codec
 
 app = Sanic(log_config=LOGGING_CONFIG)
+# seconds a stopping worker waits for in-flight requests
+app.config.GRACEFUL_SHUTDOWN_TIMEOUT = getattr(conf, 'GRACEFUL_SHUTDOWN_TIMEOUT', 15)
 
 
+# every worker sets up its own connections
 async def app_init_tasks(app, loop):
-    # await redis_client.redis.prepare_conn()
+    try:
+        await redis_client.redis.prepare_conn()
+    except Exception as e:
+        logger.error(f'redis init failed: {e}')
 
     await http_request.init_session()
+    await ip_lang.init_ip_db()
+    redis_client.redis.build_di_types()
+    asyncio.ensure_future(loop_lag.monitor())
 
     from utils import server_state
     server_state.ready = True
 
 
+# fail the health check first, so that the load balancer stops sending new requests
+async def app_drain_tasks(app, loop):
+    from utils import server_state
+    server_state.ready = False
+
+    await asyncio.sleep(getattr(conf, 'DRAIN_SECONDS', 0))
+
+
 async def app_clean_tasks(app, loop):
     from utils import server_state
     server_state.ready = False
 
     await http_request.close_session()
+    await redis_client.redis.close()
+    await ip_lang.close_ip_db()
+    content.reco_pool.close()
+    content.di_pool.close()
+    codec.close()
+
+
+# every worker binds its own socket with SO_REUSEPORT, the kernel balances connections between them
+def bind_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('0.0.0.0', conf.PORT))
+    return sock
+
+
+def run_worker():
+    app.run(debug=False, sock=bind_socket(), access_log=True)
+
+
+def run_workers(workers):
+    processes = [Process(target=run_worker) for _ in range(workers)]
+    for p in processes:
+        p.start()
+
+    def stop(signum, frame):
+        for p in processes:
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for p in processes:
+        p.join()
 
 
 if __name__ == '__main__':
     routes.settle(app)
     app.listener('before_server_start')(app_init_tasks)
-    app.listener('after_server_start')(lambda app, loop: logger.info(f'Starting server at {conf.PORT}'))
-    # app.listener('after_server_stop')(app_clean_tasks)
-    app.run(debug=False, workers=1, host='0.0.0.0', port=conf.PORT, access_log=True)
+    app.listener('after_server_start')(lambda app, loop: logger.info(f'Starting worker {os.getpid()} at {conf.PORT}'))
+    app.listener('before_server_stop')(app_drain_tasks)
+    app.listener('after_server_stop')(app_clean_tasks)
+
+    # WORKERS = 0 means one worker per cpu
+    workers = getattr(conf, 'WORKERS', 1) or os.cpu_count()
+    if workers > 1:
+        run_workers(workers)
+    else:
+        run_worker()
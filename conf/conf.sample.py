@@ -6,11 +6,110 @@ class Conf:
     IS_FAILOVER = False
 
     PORT = int(os.environ.get('PORT') or 5005)
+    # number of worker processes, 0 means one per cpu
+    WORKERS = int(os.environ.get('WORKERS') or 1)
+    # seconds a stopping worker keeps serving after failing the health check
+    DRAIN_SECONDS = 0
+    GRACEFUL_SHUTDOWN_TIMEOUT = 15
     REDIS = {
         'addresses': [
             ('127.0.0.1', 6379),
             ('127.0.0.1', 6379),
             ('127.0.0.1', 6379)
         ],
-        'password': ''
+        'password': '',
+        'minsize': 1,
+        'maxsize': 8,
+        'health_interval': 5
+    }
+    CONTENT_SVC = {
+        'HOST': '127.0.0.1',
+        'PORT': 9090,
+        'POOL_SIZE': 32
+    }
+    DI_CONTENT_SVC = {
+        'HOST': '127.0.0.1',
+        'PORT': 9091,
+        'POOL_SIZE': 32
+    }
+    # DI lookups are batched for WINDOW seconds or until MAX_SIZE ids
+    DI_BATCH = {
+        'WINDOW': 0.005,
+        'MAX_SIZE': 100
+    }
+    # per service and interface breaker of RECO/DI calls
+    CIRCUIT_BREAKER = {
+        'WINDOW': 10,
+        'MIN_CALLS': 20,
+        'FAILURE_RATE': 0.5,
+        'SLOW_MS': 1000,
+        'OPEN_SECONDS': 5,
+        'HALF_OPEN_CALLS': 3
+    }
+    # time budget (seconds) of requests by path prefix, the longest prefix wins; 0 means no deadline
+    DEADLINES = {
+        '/v1/bm/': 5
+    }
+    # seconds the shared redis tier of MemCache keeps data, by interface name
+    L2_TTL = {}
+    # background queue of redis cache writes
+    WRITE_BEHIND = {
+        'MAX_SIZE': 10000,
+        'BATCH_SIZE': 200,
+        'INTERVAL': 0.05
+    }
+    # cache payloads: decode batches and write-behind compression batches bigger than INLINE_BYTES
+    # go to a process pool, EXECUTOR = None keeps all of them on the event loop
+    CODEC = {
+        'INLINE_BYTES': 32 * 1024,
+        'EXECUTOR': 'process',
+        'WORKERS': 2
+    }
+    # use the c extension of thrift (TCompactProtocolAccelerated) when it is installed
+    THRIFT_ACCELERATED = True
+    # cache key versions are pushed by redis pub/sub, and polled every POLL_INTERVAL seconds in case a message is lost
+    VERSIONS = {
+        'POLL_INTERVAL': 30
+    }
+    # ids DI does not return are cached as missing for TTL seconds (0 turns it off),
+    # and answered locally until they expire, expired ones are pruned every PRUNE_INTERVAL seconds
+    DI_NEGATIVE = {
+        'TTL': 60,
+        'PRUNE_INTERVAL': 60,
+        'MAX_IDS': 100000
+    }
+    # in-process LRU of decoded DI objects in front of redis, TTL is capped by the redis DI ttl
+    DI_LOCAL = {
+        'CAPACITY': 10000,
+        'TTL': 60
+    }
+    # bytes all MemCache instances of a worker may hold together, shared by their weights (0 means no limit)
+    MEMCACHE_BUDGET = {
+        'BYTES': 512 * 1024 * 1024,
+        # values of the same shape are measured on one of every SAMPLE_EVERY stores
+        'SAMPLE_EVERY': 16
+    }
+    # page sizes num is rounded up to before it becomes part of a cache key
+    PAGE_SIZES = (10, 20, 30, 50)
+    # detail page related cards, per interface name over 'default':
+    # CAPACITY / TTL of the in-process cache, SAMPLES / REDIS_TTL of the per resource downgrade set in redis
+    RELATED_CARD = {
+        'default': {
+            'CAPACITY': 4096,
+            'TTL': 300,
+            'SAMPLES': 5,
+            'REDIS_TTL': 24 * 3600
+        }
+    }
+    # seconds each UA field of a card may take, a field not filled in time is left empty
+    UA_TIMEOUT = 0.5
+    # seconds the related cards of a detail page share, cards not rendered in time are loaded lazily
+    RELATED_CARDS_TIMEOUT = 0.8
+    # fetch the next page of a card list into MemCache after serving a page; cards whose prefetched pages are
+    # requested less than MIN_HIT_RATE (after MIN_SAMPLES prefetches) are only probed now and then
+    PREFETCH = {
+        'ENABLED': False,
+        'MAX_CONCURRENCY': 16,
+        'MIN_HIT_RATE': 0.2,
+        'MIN_SAMPLES': 20
     }
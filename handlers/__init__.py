@@ -1,4 +1,5 @@
 from .health import HealthView
+from .metrics import MetricsView
 from .global_view import MobileFlowView, GasCardAccountInfo, GasCardPayBill, GasCallbackMsg, FinanceAccInfoView, \
     CardPassItemListView, GasCardItemList
 from .test_view import TestMobileFlowView, TestGasCardAccountInfo, TestFinanceAccInfo, TestCardPassItemList, \
@@ -0,0 +1,8 @@
+from sanic.views import HTTPMethodView
+from sanic.response import json
+from utils import metrics
+
+
+class MetricsView(HTTPMethodView):
+    async def get(self, req):
+        return json(metrics.snapshot())
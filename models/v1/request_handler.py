@@ -1,8 +1,10 @@
+import asyncio
 from services.thrift.di import ttypes as dittypes
 from services import fetch_di_detail_page_info, fetch_di_one_detail, \
                      get_history_multiple, get_watchlist_multiple, get_subscribe_multiple, get_thumb_multiple, \
                      get_history_single, get_watchlist_single, get_subscribe_single, get_thumb_single
-from conf import enum
+from conf import conf, enum
+from utils import logger, metrics, deadline, print_excp
 from .resource import ShortVideo, Publisher, MovieFilm, MusicVideo, MusicPlaylistQueue, \
                       MusicPlaylist, MusicAlbum, MusicAlbumQueue, MusicArtist, TvEpisode, TvSeason, TvShow
 from .resource.live_tv import LiveChannel, LiveProgramme, LiveChannelPagingPrograms
@@ -38,6 +40,22 @@ UA_MULTIPLE = {
     enum.CARD_THUMB: get_thumb_multiple
 }
 
+UA_TIMEOUT = 0.5
+RELATED_CARDS_TIMEOUT = 0.8
+
+
+# ua数据只影响各自的字段，失败或超时时该字段不填，不影响整个卡片
+async def fetch_ua(t, cor):
+    try:
+        return await asyncio.wait_for(cor, deadline.budget(f'UA:{t}', getattr(conf, 'UA_TIMEOUT', UA_TIMEOUT)))
+    except Exception as e:
+        if asyncio.iscoroutine(cor):
+            cor.close()
+        logger.error(f'ua {t} failed: {e!r}')
+        metrics.incr(f'ua:{t}:failed')
+        return None
+
+
 def rec_type_to_cls(req):
     res = {
         **REC_TYPE_TO_CLS_BASE
@@ -85,11 +103,11 @@ class ResourceGroupBuilder:
         for typ, ids in type_ids.items():
             idwts.append(dittypes.IdsWithType(ids=ids, type=typ))
 
-        di = await fetch_di_detail_page_info(req, idwts) # pylint: disable=no-value-for-parameter
-        # 处理ua请求
+        # di请求和ua请求并发进行
         uid = req['user'].id
         ua_res = {}
-        for t, m in UA_MULTIPLE.items():
+        ua_rids = {}
+        for t in UA_MULTIPLE:
             rids = []
             for it in rec_list:
                 rid = it.id
@@ -100,9 +118,23 @@ class ResourceGroupBuilder:
                     ua_res.setdefault(rid, {})[t] = ua
 
             if len(rids) > 0:
-                items = await m(uid, rids)
-                for j, item in enumerate(items or []):
-                    ua_res.setdefault(rids[j], {})[t] = item
+                ua_rids[t] = rids
+
+        di, *uas = await asyncio.gather(
+            fetch_di_detail_page_info(req, idwts), # pylint: disable=no-value-for-parameter
+            *[fetch_ua(t, UA_MULTIPLE[t](uid, rids)) for t, rids in ua_rids.items()],
+            return_exceptions=True)
+
+        if isinstance(di, BaseException):
+            print_excp(di)
+            di = None
+
+        for (t, rids), items in zip(ua_rids.items(), uas):
+            if isinstance(items, BaseException):
+                continue
+
+            for j, item in enumerate(items or []):
+                ua_res.setdefault(rids[j], {})[t] = item
 
         objs = {}
 
@@ -136,16 +168,30 @@ class ResourceProfileBuilder:
         uid = req['user'].id
         rid = rec.id
         typ = rec.type
-        di = await fetch_di_one_detail(req, typ, rid) # pylint: disable=no-value-for-parameter
 
         ua_res = {}
-        for t, m in UA_SINGLE.items():
+        ua_ts = []
+        for t in UA_SINGLE:
             ua = rec.ua.get(t)
             if ua is True:
-                ua_res[t] = await m(uid, rid, redirect_type=enum.REC_TO_UA[typ])
+                ua_ts.append(t)
             elif isinstance(ua, dict):
                 ua_res[t] = ua
 
+        # di请求和ua请求并发进行
+        di, *uas = await asyncio.gather(
+            fetch_di_one_detail(req, typ, rid), # pylint: disable=no-value-for-parameter
+            *[fetch_ua(t, UA_SINGLE[t](uid, rid, redirect_type=enum.REC_TO_UA[typ])) for t in ua_ts],
+            return_exceptions=True)
+
+        if isinstance(di, BaseException):
+            print_excp(di)
+            di = None
+
+        for t, item in zip(ua_ts, uas):
+            if not isinstance(item, BaseException):
+                ua_res[t] = item
+
         res = None
         for tp in (di and di.typeList or []):
             if tp != typ:
@@ -191,3 +237,43 @@ class CardPagingBuilder:
             await paging.render()
 
         return paging
+
+
+# 详情页的相关卡片并发渲染，共用一个时间预算，超时或失败的卡片由客户端通过CardPagingBuilder再加载
+class RelatedCardsBuilder:
+    @staticmethod
+    async def build(req, api_type):
+        API_TYPE_TO_CLS = api_type_to_cls(req)
+        Ctor = API_TYPE_TO_CLS.get(api_type)
+        if Ctor is None:
+            return []
+
+        # a related card is the same paging CardPagingBuilder serves for relatedType and interface
+        pagings = [Paging(req, getattr(Paging, 'CARD_ID', Paging.INTERFACE)) for Paging in Ctor.RELATED_CARDS]
+        tasks = [asyncio.ensure_future(paging.render()) for paging in pagings]
+        if len(tasks) == 0:
+            return []
+
+        try:
+            timeout = deadline.budget('RELATED', getattr(conf, 'RELATED_CARDS_TIMEOUT', RELATED_CARDS_TIMEOUT))
+            await asyncio.wait(tasks, timeout=timeout)
+        except deadline.DeadlineExceeded:
+            pass
+
+        for paging, task in zip(pagings, tasks):
+            failed = task.done() and not task.cancelled() and task.exception() is not None
+            paging.lazy = not task.done() or failed
+            if not paging.lazy:
+                continue
+
+            if failed:
+                print_excp(task.exception())
+                metrics.incr(f'related:{paging.INTERFACE}:failed')
+            else:
+                # not cancelled, the render finishes in the background and warms the cache for the lazy load
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                metrics.incr(f'related:{paging.INTERFACE}:lazy')
+
+            paging.lazy_params = {'relatedType': api_type, 'interface': paging.INTERFACE}
+
+        return pagings
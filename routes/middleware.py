@@ -8,7 +8,7 @@ from shortuuid import uuid
 from sanic.response import text
 
 from conf import conf
-from utils import logger
+from utils import logger, deadline
 from utils.jsonv import validate
 from .req_context import ReqContext
 from handlers import base_fn
@@ -21,6 +21,7 @@ MIME_TYPES_TO_GZIP = frozenset([
 GZIP_MIN_SIZE = 500
 GZIP_LEVEL = 5
 PROTECT_HEADERS = ['xtimestamp', 'xtoken']
+DEADLINE = 3
 
 
 # if conf.IS_PROD \
@@ -84,6 +85,18 @@ def mark_req_start_time(req):
     req['_start_time'] = time.time()
 
 
+# conf.DEADLINES maps path prefixes to the time budget (seconds) of a request, the longest prefix wins
+def set_deadline(req):
+    seconds = DEADLINE
+    matched = ''
+    for prefix, secs in getattr(conf, 'DEADLINES', {}).items():
+        if req.path.startswith(prefix) and len(prefix) >= len(matched):
+            seconds, matched = secs, prefix
+
+    req['deadline'] = req['_start_time'] + seconds if seconds else None
+    deadline.reset(req['deadline'])
+
+
 def mark_req_end_time(req, res):
     time_ms_spent = int((time.time() - req['_start_time']) * 1000)
 
@@ -5,7 +5,7 @@ from sanic.response import text
 from sanic.handlers import ErrorHandler
 from sanic.exceptions import NotFound
 from .middleware import append_logid, header_protect, append_req_context, append_headers, \
-    append_user, mark_req_start_time, mark_req_end_time, gzip_res
+    append_user, mark_req_start_time, mark_req_end_time, gzip_res, set_deadline
 from conf import route_map
 
 
@@ -22,6 +22,7 @@ def settle(app: sanic.Sanic):
     app.error_handler = ExceptionHandler()
     app.middleware('request')(append_logid)
     app.middleware('request')(mark_req_start_time)
+    app.middleware('request')(set_deadline)
     app.middleware('request')(header_protect)
     app.middleware('request')(append_req_context)
     app.middleware('request')(append_user)
@@ -31,6 +32,7 @@ def settle(app: sanic.Sanic):
 
     app.add_route(handlers.HealthView.as_view(), '/')
     app.add_route(handlers.HealthView.as_view(), '/health')
+    app.add_route(handlers.MetricsView.as_view(), '/metrics')
     add_route(app, route_map.MOBIE_FLOW_VIEW)
     add_route(app, route_map.TEST_MOBILE_FLOW_VIEW)
     add_route(app, route_map.GAS_CARD_ACCOUNT_INFO_VIEW)
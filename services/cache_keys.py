@@ -0,0 +1,152 @@
+import inspect
+from hashlib import md5
+import ujson
+from functools import wraps
+from conf import conf
+from utils import metrics
+
+PAGE_SIZES = (10, 20, 30, 50)
+MAX_TRACKED = 100000
+
+
+# rules map an argument value to its normalized value, which is what the call and every cache key below it see
+
+def dedupe(values):
+    if values is None:
+        return values
+    return list(dict.fromkeys(values))
+
+
+# for list args that are sets, like filters
+def sort_dedupe(values):
+    if values is None:
+        return values
+    return sorted(set(values))
+
+
+# smallest allowed page size which is not smaller than num, above the largest one a multiple of it,
+# so the client still gets all it asked for; anything but a positive int is left as it is
+def clamp(sizes=None):
+    def rule(num):
+        allowed = sorted(sizes or getattr(conf, 'PAGE_SIZES', PAGE_SIZES))
+        if not isinstance(num, int) or isinstance(num, bool) or num <= 0:
+            return num
+        for size in allowed:
+            if num <= size:
+                return size
+
+        largest = allowed[-1]
+        return -(-num // largest) * largest
+
+    return rule
+
+
+# latest of versions not newer than version, the oldest one for older clients
+def bucket(versions):
+    def rule(version):
+        res = None
+        for v in versions:
+            if version >= v:
+                res = v
+            else:
+                break
+
+        return res or versions[0]
+
+    return rule
+
+
+# the argument does not change the result, every call sends value instead
+def drop(value=None):
+    return lambda _: value
+
+
+# one short key for many arguments; list order is kept, as it is what the request sends, so lists whose
+# order does not matter should be normalized with sort_dedupe first
+def canonical_hash(*values):
+    canonical = [list(v) if isinstance(v, (list, tuple)) else v for v in values]
+    return md5(ujson.dumps(canonical).encode()).hexdigest()
+
+
+def hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class KeyStats:
+    '''distinct cache keys before and after normalization, and the hit ratio an unbounded cache keyed by them
+    would have; the keys are the ones of the MemCache below, the normalized arguments where there is none'''
+
+    def __init__(self, name):
+        self.calls = 0
+        self.raw = set()
+        self.normalized = set()
+        self.raw_hits = 0
+        self.hits = 0
+
+        metrics.gauge(f'keys:{name}:raw_distinct', lambda: len(self.raw))
+        metrics.gauge(f'keys:{name}:distinct', lambda: len(self.normalized))
+        metrics.gauge(f'keys:{name}:raw_hit_ratio', lambda: self.raw_hits / self.calls if self.calls else 0)
+        metrics.gauge(f'keys:{name}:hit_ratio', lambda: self.hits / self.calls if self.calls else 0)
+
+    def record(self, raw, normalized):
+        # stop counting once full, the ratios so far stay meaningful
+        if len(self.raw) >= MAX_TRACKED:
+            return
+
+        self.calls += 1
+        if raw in self.raw:
+            self.raw_hits += 1
+        else:
+            self.raw.add(raw)
+
+        if normalized in self.normalized:
+            self.hits += 1
+        else:
+            self.normalized.add(normalized)
+
+
+# normalize named arguments before the cache decorators below build their keys, e.g.
+#   @normalize(langList=dedupe, num=clamp(), genres=sort_dedupe)
+def normalize(**rules):
+    def wrapper(f):
+        # wrappers like tclient take leading arguments away, so positional ones are found from the end, as in MemCache
+        params = inspect.signature(f).parameters
+        positional = [name for name, p in params.items() if p.default is inspect.Parameter.empty]
+        positions = {name: positional.index(name) - len(positional) for name in rules if name in positional}
+        stats = KeyStats(f.__name__)
+        cache_key = getattr(f, 'cache_key', None)
+
+        @wraps(f)
+        async def g(*args, **kwargs):
+            raw_args = args
+            args = list(args)
+            raw, normalized = [], []
+            for name, rule in rules.items():
+                i = positions.get(name)
+                if i is not None and -i <= len(args):
+                    value = args[i]
+                    args[i] = rule(value)
+                    new = args[i]
+                elif name in kwargs:
+                    value = kwargs[name]
+                    kwargs[name] = new = rule(value)
+                else:
+                    continue
+
+                raw.append(hashable(value))
+                normalized.append(hashable(new))
+
+            if cache_key is None:
+                stats.record(tuple(raw), tuple(normalized))
+            else:
+                try:
+                    stats.record(cache_key(raw_args), cache_key(args))
+                except IndexError:
+                    # too few positional arguments for MemCache, the call itself fails below
+                    pass
+
+            return await f(*args, **kwargs)
+
+        return g
+
+    return wrapper
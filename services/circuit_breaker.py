@@ -0,0 +1,103 @@
+from collections import deque
+from time import time
+from conf import conf
+from utils import logger, metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_CODE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+WINDOW = 10  # seconds of calls used to compute the failure rate
+MIN_CALLS = 20
+FAILURE_RATE = 0.5
+SLOW_MS = 1000  # a call slower than this counts as a failure
+OPEN_SECONDS = 5
+HALF_OPEN_CALLS = 3
+
+breakers = {}
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        cfg = getattr(conf, 'CIRCUIT_BREAKER', {})
+        self.name = name
+        self.window = cfg.get('WINDOW', WINDOW)
+        self.min_calls = cfg.get('MIN_CALLS', MIN_CALLS)
+        self.failure_rate = cfg.get('FAILURE_RATE', FAILURE_RATE)
+        self.slow_ms = cfg.get('SLOW_MS', SLOW_MS)
+        self.open_seconds = cfg.get('OPEN_SECONDS', OPEN_SECONDS)
+        self.half_open_calls = cfg.get('HALF_OPEN_CALLS', HALF_OPEN_CALLS)
+
+        self.state = CLOSED
+        self._calls = deque()  # (timestamp, failed)
+        self._failures = 0
+        self._opened_at = 0
+        self._trials = 0
+        self._trial_ok = 0
+
+        metrics.gauge(f'circuit:{name}:state', lambda: STATE_CODE[self.state])
+
+    def _to(self, state):
+        logger.warning(f'[CIRCUIT] {self.name} {self.state} -> {state}')
+        metrics.incr(f'circuit:{self.name}:{state}')
+        self.state = state
+        self._calls.clear()
+        self._failures = 0
+        self._trials = 0
+        self._trial_ok = 0
+        self._opened_at = time()
+
+    def allow(self):
+        if self.state == OPEN:
+            if time() - self._opened_at < self.open_seconds:
+                metrics.incr(f'circuit:{self.name}:rejected')
+                return False
+            self._to(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_calls:
+                # trial calls which never reported back (e.g. cut by the request deadline) are given up
+                if time() - self._opened_at < self.open_seconds:
+                    metrics.incr(f'circuit:{self.name}:rejected')
+                    return False
+                self._trials = self._trial_ok = 0
+                self._opened_at = time()
+            self._trials += 1
+
+        return True
+
+    def record(self, ok, ms):
+        failed = not ok or ms > self.slow_ms
+
+        if self.state == OPEN:
+            return
+
+        if self.state == HALF_OPEN:
+            if failed:
+                self._to(OPEN)
+            else:
+                self._trial_ok += 1
+                if self._trial_ok >= self.half_open_calls:
+                    self._to(CLOSED)
+            return
+
+        now = time()
+        self._calls.append((now, failed))
+        self._failures += failed
+        while self._calls and now - self._calls[0][0] > self.window:
+            _, f = self._calls.popleft()
+            self._failures -= f
+
+        total = len(self._calls)
+        if self.state == CLOSED and total >= self.min_calls and self._failures / total >= self.failure_rate:
+            self._to(OPEN)
+
+
+def get_breaker(service, interface):
+    name = f'{service}:{interface}'
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers[name] = CircuitBreaker(name)
+
+    return breaker
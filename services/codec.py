@@ -0,0 +1,102 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+import lz4.frame
+from conf import conf
+from thrift.transport.TTransport import TMemoryBuffer
+from utils import metrics
+from . import thrift_protocol
+
+INLINE_BYTES = 32 * 1024  # batches smaller than this are encoded / decoded on the event loop
+EXECUTOR = 'process'
+WORKERS = 2
+
+executor = None
+
+
+# thrift compact bytes of an object, not compressed yet, see encode and finish
+class Pending(bytes):
+    pass
+
+
+# the thrift encoding of obj, taken now so later changes of the shared obj are not stored;
+# bytes are stored as they are
+def encode(obj):
+    if isinstance(obj, bytes):
+        return obj
+
+    mobj = TMemoryBuffer()
+    cobj = thrift_protocol.protocol(mobj)
+    obj.write(cobj)
+    return Pending(mobj.getvalue())
+
+
+def compress_all(datas):
+    return [lz4.frame.compress(data) for data in datas]
+
+
+# thrift compact + lz4, the format of every object stored in redis: compresses the Pending datas of a batch,
+# in the process pool when they are big
+async def finish(datas):
+    pending = [i for i, data in enumerate(datas) if isinstance(data, Pending)]
+    if len(pending) == 0:
+        return datas
+
+    compressed = await run('encode', sum(len(datas[i]) for i in pending), compress_all, [datas[i] for i in pending])
+    res = list(datas)
+    for i, data in zip(pending, compressed):
+        res[i] = data
+    return res
+
+
+def loads(creator, data):
+    obj = creator()
+    mobj = TMemoryBuffer(lz4.frame.decompress(data))
+    cobj = thrift_protocol.protocol(mobj)
+    obj.read(cobj)
+    return obj
+
+
+def loads_all(pairs):
+    return [loads(creator, data) for creator, data in pairs]
+
+
+# only a process pool decodes in parallel, the python thrift decoder holds the GIL
+def get_executor():
+    global executor
+    cfg = getattr(conf, 'CODEC', {})
+    if executor is None and cfg.get('EXECUTOR', EXECUTOR) == 'process':
+        executor = ProcessPoolExecutor(cfg.get('WORKERS', WORKERS))
+
+    return executor
+
+
+def inline_bytes():
+    return getattr(conf, 'CODEC', {}).get('INLINE_BYTES', INLINE_BYTES)
+
+
+async def run(name, size, fn, arg):
+    if size < inline_bytes() or get_executor() is None:
+        start = time()
+        res = fn(arg)
+        metrics.observe(f'codec:{name}:inline', 1000 * (time() - start))
+        return res
+
+    metrics.incr(f'codec:{name}:offloaded')
+    return await asyncio.get_event_loop().run_in_executor(get_executor(), fn, arg)
+
+
+# decode [(creator, data)], in the process pool when the data is big
+async def decode(pairs):
+    return await run('decode', sum(len(data) for _, data in pairs), loads_all, pairs)
+
+
+async def decode_list(creator, datas):
+    return await decode([(creator, data) for data in datas if data is not None])
+
+
+def close():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False)
+        executor = None
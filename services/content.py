@@ -1,34 +1,45 @@
 import asyncio
 from time import time
+from functools import wraps
 from datetime import datetime
-from thrift import TTornado
-from thrift.protocol.TCompactProtocol import TCompactProtocolFactory
 from .thrift.recommend import RecommendService, ttypes as recttypes
 from .thrift.di import DIService, ttypes as dittypes
 from conf import conf, enum
-from .redis_client import redis
+from .redis_client import redis, related_card_conf
 from .mem_cache import MemCache
-from utils import logger
+from .thrift_pool import ThriftPool
+from .di_batcher import DIBatcher
+from .circuit_breaker import get_breaker
+from .cache_keys import normalize, dedupe, sort_dedupe, clamp, bucket, canonical_hash
+from .prefetch import prefetch
+from utils import logger, deadline, downgrade as downgrade_flag
 
 RECO_SERVICE_NAME = 'RECO'
 DI_SERVICE_NAME = 'DI'
 NETWORK_STATUS = '3G'
 ANDROID_PLATEFORM_ID = '1'
 TIMEOUT = 2 if conf.IS_PROD else None
+DOWNGRADE_TIMEOUT = 1
+
+reco_pool = ThriftPool(RECO_SERVICE_NAME, conf.CONTENT_SVC, RecommendService.Client)
+di_pool = ThriftPool(DI_SERVICE_NAME, conf.DI_CONTENT_SVC, DIService.Client)
 
 
 def get_UTC_time():
     return f'{int(datetime.now().timestamp() * 1000)}'
 
 async def timeout(cor, timeout):
-    done, _ = await asyncio.wait([cor], timeout=timeout)
+    done, pending = await asyncio.wait([cor], timeout=timeout)
     if len(done) > 0:
         return done.pop().result()
     else:
+        for task in pending:
+            task.cancel()
         raise(Exception('Operation Timeout'))
 
 def timing(serviceName, interfaceName):
     def wrapper(f):
+        @wraps(f)
         async def g(*args, **kwargs):
             start = time()
             res = await f(*args, **kwargs)
@@ -40,6 +51,7 @@ def timing(serviceName, interfaceName):
     return wrapper
 
 def expand_request(f):
+    @wraps(f)
     async def g(*args, **kwargs):
         req = args[0]
         xheaders = req['xheaders']
@@ -54,55 +66,82 @@ def expand_request(f):
         return await f(app_version, country, lang, prefre_lang, uid, *args[1:], **kwargs)
     return g
 
-# 因为app_version这个参数会影响到MemCache，
-# 在向底层服务发送请求的时候将客户端传来的app-version转换成一个最近一次发版的版本号，
-# 这样可以缓解因为app_version参数值过多引起MemCache所需内存的膨胀
-def normalize_app_version(versions):
-    def wrapper(f):
-        async def g(*args, **kwargs):
-            app_version = None
-            version = args[0]
-            for v in versions:
-                if version >= v:
-                    app_version = v
-                else:
-                    break
 
-            if not app_version:
-                app_version = versions[0]
-            return await f(app_version, *args[1:], **kwargs)
-        return g
-    return wrapper
+# cursors of the next page, the responses carry them in the field the request sent them in
+def response_next(res):
+    return getattr(res, 'finalId', None)
+
+
+def tabs_next(res):
+    return getattr(res[0], 'nextToken', None) if len(res) > 0 else None
+
+
+# in-process cache of a detail page related card, keyed by lang and the arguments at indices,
+# capacity and ttl per interface from conf.RELATED_CARD
+def related_cache(interfaceName, *indices):
+    cfg = related_card_conf(interfaceName)
+    return MemCache(cfg['CAPACITY'], 2, *indices, ttl=cfg['TTL'])
+
+
+# 从Redis中取降级数据，请求的deadline已过时直接返回None
+async def downgrade_call(f, *args, **kwargs):
+    downgrade_flag.mark()
+    try:
+        return await timeout(f(None, *args, **kwargs), deadline.budget(f'{RECO_SERVICE_NAME}:downgrade', DOWNGRADE_TIMEOUT))
+    except deadline.DeadlineExceeded as e:
+        logger.error(f"{kwargs['log_id']} {e}")
+        return None
 
 
 # downgrade表示是否需要向redis中取降级数据
 def tclient(downgrade):
     def wrapper(f):
+        breaker = get_breaker(RECO_SERVICE_NAME, f.__name__)
+
+        @wraps(f)
         async def g(*args, **kwargs):
             if conf.IS_FAILOVER:
                 if downgrade:
+                    downgrade_flag.mark()
                     return await f(None, *args, **kwargs)
                 else:
                     return None
 
+            # 熔断打开时不访问推荐服务，直接降级
+            if not breaker.allow():
+                if downgrade:
+                    return await downgrade_call(f, *args, **kwargs)
+                else:
+                    return None
+
             res = None
-            opened = False
-            re_conn = TTornado.TTornadoStreamTransport(conf.CONTENT_SVC['HOST'], conf.CONTENT_SVC['PORT'])
+            conn = None
+            ok = False
+            expired = False
+            start = time()
 
             try:
-                re_conn.open()
-                opened = True
-                tclient = RecommendService.Client(re_conn, TCompactProtocolFactory())
-                res = await timeout(f(tclient, *args, **kwargs), TIMEOUT)
+                conn = await reco_pool.acquire(deadline.budget(RECO_SERVICE_NAME, TIMEOUT))
+                res = await timeout(f(conn.client, *args, **kwargs), deadline.budget(RECO_SERVICE_NAME, TIMEOUT))
+                ok = True
+            except deadline.DeadlineExceeded as e:
+                logger.error(f"{kwargs['log_id']} {e}")
+                expired = True
             except Exception as e:
                 logger.error(f"{kwargs['log_id']} {e}")
-
-                # 降级到Redis中取数据
-                if downgrade:
-                    res = await timeout(f(None, *args, **kwargs), 1)
+                expired = deadline.exceeded(RECO_SERVICE_NAME)
+                if conn is not None:
+                    conn.broken = True
             finally:
-                if opened:
-                    re_conn.close()
+                # 请求超出deadline不算作服务的失败
+                if not expired:
+                    breaker.record(ok, 1000 * (time() - start))
+                if conn is not None:
+                    reco_pool.release(conn)
+
+            # 降级到Redis中取数据
+            if not ok and downgrade:
+                res = await downgrade_call(f, *args, **kwargs)
 
             return res
 
@@ -111,24 +150,36 @@ def tclient(downgrade):
 
 
 def diclient(f):
+    breaker = get_breaker(DI_SERVICE_NAME, f.__name__)
+
+    @wraps(f)
     async def g(*args, **kwargs):
-        if conf.IS_FAILOVER:
+        if conf.IS_FAILOVER or not breaker.allow():
             return None
 
         res = None
-        opened = False
-        di_conn = TTornado.TTornadoStreamTransport(conf.DI_CONTENT_SVC['HOST'], conf.DI_CONTENT_SVC['PORT'])
+        conn = None
+        ok = False
+        expired = False
+        start = time()
 
         try:
-            di_conn.open()
-            opened = True
-            diclient = DIService.Client(di_conn, TCompactProtocolFactory())
-            res = await timeout(f(diclient, *args, **kwargs), TIMEOUT)
+            conn = await di_pool.acquire(deadline.budget(DI_SERVICE_NAME, TIMEOUT))
+            res = await timeout(f(conn.client, *args, **kwargs), deadline.budget(DI_SERVICE_NAME, TIMEOUT))
+            ok = True
+        except deadline.DeadlineExceeded as e:
+            logger.error(f"{kwargs['log_id']} {e}")
+            expired = True
         except Exception as e:
             logger.error(f"{kwargs['log_id']} {e}")
+            expired = deadline.exceeded(DI_SERVICE_NAME)
+            if conn is not None:
+                conn.broken = True
         finally:
-            if opened:
-                di_conn.close()
+            if not expired:
+                breaker.record(ok, 1000 * (time() - start))
+            if conn is not None:
+                di_pool.release(conn)
 
         return res
     return g
@@ -141,7 +192,7 @@ async def test(tclient):
 # get all the names of the tabs which contains the data
 @timing(RECO_SERVICE_NAME, enum.TABS_LIST_INTERFACE)
 @expand_request
-@MemCache(32, -3) # lang
+@MemCache(32, -3, grace=600, beta=1, l2=redis.l2(recttypes.Tabs, enum.TABS_LIST_INTERFACE, many=True)) # lang
 @tclient(True)
 @redis.cache_list(recttypes.Tabs, enum.TABS_LIST_INTERFACE)
 async def fetch_tab_names(tclient, app_version, country, lang, langList, user_id, log_id=None, app_code=None):
@@ -155,7 +206,8 @@ async def fetch_tab_names(tclient, app_version, country, lang, langList, user_id
 # get banner data
 @timing(RECO_SERVICE_NAME, enum.BANNER_INTERFACE_NAME)
 @expand_request
-@MemCache(2048, -3, -1) # lang tab_id
+@normalize(langList=dedupe)
+@MemCache(2048, -3, -1, grace=600, beta=1, l2=redis.l2(recttypes.Banner, enum.BANNER_INTERFACE_NAME, many=True)) # lang tab_id
 @tclient(True)
 @redis.cache_list(recttypes.Banner, enum.BANNER_INTERFACE_NAME, id_index=-1)
 async def fetch_banner_data(tclient, app_version, country, lang, langList, user_id, tab_id, log_id=None, app_code=None):
@@ -179,8 +231,12 @@ async def fetch_related_banner_data(tclient, app_version, country, lang, langLis
 
 @timing(RECO_SERVICE_NAME, enum.TABS_INTERFACE_NAME)
 @expand_request
-@normalize_app_version([enum.VERSION_BASE, enum.VERSION_1065, enum.VERSION_NEWEST])
-@MemCache(16384, -8, -5, -3, -2, -1) # lang tabId num nextToken
+# 因为app_version这个参数会影响到MemCache，
+# 在向底层服务发送请求的时候将客户端传来的app-version转换成一个最近一次发版的版本号，
+# 这样可以缓解因为app_version参数值过多引起MemCache所需内存的膨胀
+@normalize(app_version=bucket([enum.VERSION_BASE, enum.VERSION_1065, enum.VERSION_NEWEST]), langList=dedupe, num=clamp())
+@prefetch('nextToken', 'tabId', tabs_next)
+@MemCache(16384, -8, -5, -3, -2, -1, tinylfu=True, weight=2, l2=redis.l2(recttypes.Tabs, enum.TABS_INTERFACE_NAME, many=True)) # lang tabId num nextToken
 @tclient(True)
 async def fetch_tabs_data(tclient, app_version, country, lang, langList, user_id, tabId, num, nextToken, log_id=None, app_code=None):
     # if app_version >= enum.VERSION_1065:
@@ -220,7 +276,9 @@ async def fetch_list_data(app_version, country, lang, langList, user_id, card_id
 
 # get the list of recommend data
 @timing(RECO_SERVICE_NAME, enum.CARDLIST_INTERFACE_NAME)
-@MemCache(16384, -5, -3, -2, -1) # lang card_id num next type
+@normalize(langList=dedupe, num=clamp())
+@prefetch('next', 'card_id', response_next, type=1)
+@MemCache(16384, -5, -3, -2, -1, grace=300, tinylfu=True, weight=4, l2=redis.l2(recttypes.Response, enum.CARDLIST_INTERFACE_NAME)) # lang card_id num next type
 @tclient(True)
 @redis.cache_card(enum.CARDLIST_INTERFACE_NAME, id_index=-5)
 async def fetch_normal_list_data(tclient, app_version, country, lang, langList, user_id, card_id, tab_id, num, next, type,
@@ -248,7 +306,8 @@ async def fetch_nullcard_list_data(tclient, app_version, country, lang, langList
 # get the programs of the live tv channel
 @timing(RECO_SERVICE_NAME, enum.CARDLIST_LIVE_CARD_NAME)
 @expand_request
-@MemCache(1024, -6, -5, -4, -3, -1)
+@normalize(langList=dedupe, num=clamp())
+@MemCache(1024, -6, -5, -4, -3, -1, l2=redis.l2(recttypes.Response, enum.CARDLIST_LIVE_CARD_NAME))
 @tclient(True)
 @redis.cache_card(enum.CARDLIST_LIVE_CARD_NAME, id_index=-3)
 async def fetch_live_tv_programs(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceId, resourceType, nextToken,
@@ -263,7 +322,7 @@ async def fetch_live_tv_programs(tclient, app_version, country, lang, langList,
 # get all live tv channels
 @timing(RECO_SERVICE_NAME, enum.ALL_LIVE_CAHNNELS_INTERFACE_NAME)
 @expand_request
-@MemCache(8, -1)
+@MemCache(8, -1, l2=redis.l2(recttypes.Response, enum.ALL_LIVE_CAHNNELS_INTERFACE_NAME))
 @tclient(True)
 @redis.cache_card(enum.ALL_LIVE_CAHNNELS_INTERFACE_NAME)
 async def fetch_all_live_channels(tclient, app_version, country, lang, langList, user_id, num, log_id=None, app_code=None):
@@ -273,19 +332,25 @@ async def fetch_all_live_channels(tclient, app_version, country, lang, langList,
         platformId=ANDROID_PLATEFORM_ID, clientVersion=app_code, logId=log_id)
     return await tclient.recommend(req)
 
-# get detail page by a group of ids and their type
-@timing(DI_SERVICE_NAME, 'group')
-@expand_request
-@redis.cache_details(idts_index=-1)
+# DI lookups of concurrent requests are merged into one getDetail by di_batcher
 @diclient
-@timing(DI_SERVICE_NAME, 'service:group')
-async def fetch_di_detail_page_info(diclient, app_version, country, lang, langList, user_id, ids_with_types, log_id=None, app_code=None):
+@timing(DI_SERVICE_NAME, 'service:batch')
+async def fetch_di_detail_batch(diclient, ids_with_types, log_id=None):
     req = dittypes.DIRequest(idsWithTypes=ids_with_types, serviceName=None, timeSign=get_UTC_time(), logId=log_id)
     res = await diclient.getDetail(req)
     return res
 
+di_batcher = DIBatcher(fetch_di_detail_batch)
+
+# get detail page by a group of ids and their type
+@timing(DI_SERVICE_NAME, 'group')
+@expand_request
+@redis.cache_details(idts_index=-1)
+async def fetch_di_detail_page_info(app_version, country, lang, langList, user_id, ids_with_types, log_id=None, app_code=None):
+    return await di_batcher.get(ids_with_types, log_id=log_id)
+
 
-# get one detail info by type and id
+# get one detail info by type and id, not batched since it is localized by lang
 @timing(DI_SERVICE_NAME, 'one')
 @expand_request
 @redis.cache_details(type_index=-2, id_index=-1)
@@ -301,8 +366,9 @@ async def fetch_di_one_detail(diclient, app_version, country, lang, langList, us
 # get related short videos
 @timing(RECO_SERVICE_NAME, enum.GENERAL_VIDEO_RELATED_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.GENERAL_VIDEO_RELATED_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.GENERAL_VIDEO_RELATED_INTERFACE_NAME, -6, -5, -4, -3, -2, -1) # lang num next type filterId resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.GENERAL_VIDEO_RELATED_INTERFACE_NAME, id_index=-1)
 async def fetch_related_video(tclient, app_version, country, lang, langList, user_id, num, next, type, filterId, resourceType, resourceId,
     log_id=None, app_code=None):
     req = recttypes.Request(
@@ -316,8 +382,9 @@ async def fetch_related_video(tclient, app_version, country, lang, langList, use
 # get other short videos of this publisher
 @timing(RECO_SERVICE_NAME, enum.OTHER_SHORTVIDEO_OF_THE_PUBLISHER)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.OTHER_SHORTVIDEO_OF_THE_PUBLISHER, id_index=-1)
+@related_cache(enum.OTHER_SHORTVIDEO_OF_THE_PUBLISHER, -6, -5, -4, -3, -2, -1) # lang num next type filterId resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.OTHER_SHORTVIDEO_OF_THE_PUBLISHER, id_index=-1)
 async def fetch_other_short_video_of_the_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, filterId, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -331,8 +398,9 @@ async def fetch_other_short_video_of_the_publisher(tclient, app_version, country
 # get similar publishers
 @timing(RECO_SERVICE_NAME, enum.SIMIALR_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SIMIALR_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SIMIALR_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SIMIALR_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_similar_publishers(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType, resourceId,
     log_id=None, app_code=None):
     req = recttypes.Request(
@@ -345,8 +413,9 @@ async def fetch_similar_publishers(tclient, app_version, country, lang, langList
 # get popular videos of publisher
 @timing(RECO_SERVICE_NAME, enum.POPULAR_VIDEOS_OF_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.POPULAR_VIDEOS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.POPULAR_VIDEOS_OF_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.POPULAR_VIDEOS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_popular_vidoes_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -360,8 +429,9 @@ async def fetch_popular_vidoes_of_publisher(tclient, app_version, country, lang,
 # get recent videos of publisher
 @timing(RECO_SERVICE_NAME, enum.RECENT_VIDEOS_OF_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.RECENT_VIDEOS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.RECENT_VIDEOS_OF_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.RECENT_VIDEOS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_recent_vidoes_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -375,8 +445,9 @@ async def fetch_recent_vidoes_of_publisher(tclient, app_version, country, lang,
 # sort by popular of all short videos of this publisher
 @timing(RECO_SERVICE_NAME, enum.SHORTVIDEO_POPULAR_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SHORTVIDEO_POPULAR_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SHORTVIDEO_POPULAR_INTERFACE_NAME, -6, -5, -4, -3, -2, -1) # lang num next type filterId resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SHORTVIDEO_POPULAR_INTERFACE_NAME, id_index=-1)
 async def fetch_popular_short_videos_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, filterId,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -391,8 +462,9 @@ async def fetch_popular_short_videos_of_publisher(tclient, app_version, country,
 # sort by lastest released of all short videos of this publisher
 @timing(RECO_SERVICE_NAME, enum.SHORTVIDEO_LATEST_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SHORTVIDEO_LATEST_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SHORTVIDEO_LATEST_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SHORTVIDEO_LATEST_INTERFACE_NAME, id_index=-1)
 async def fetch_lastest_short_videos_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -405,8 +477,9 @@ async def fetch_lastest_short_videos_of_publisher(tclient, app_version, country,
 # get the tv shows of the publisher
 @timing(RECO_SERVICE_NAME, enum.TVSHOW_OF_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.TVSHOW_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.TVSHOW_OF_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.TVSHOW_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_tv_shows_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -419,8 +492,9 @@ async def fetch_tv_shows_of_publisher(tclient, app_version, country, lang, langL
 # get the albums of the publisher
 @timing(RECO_SERVICE_NAME, enum.ALBUMS_OF_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.ALBUMS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.ALBUMS_OF_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.ALBUMS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_albums_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -433,8 +507,9 @@ async def fetch_albums_of_publisher(tclient, app_version, country, lang, langLis
 # get the artists of the publisher
 @timing(RECO_SERVICE_NAME, enum.ARTISTS_OF_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.ARTISTS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.ARTISTS_OF_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.ARTISTS_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_artists_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -447,8 +522,9 @@ async def fetch_artists_of_publisher(tclient, app_version, country, lang, langLi
 # get the movies of the publisher
 @timing(RECO_SERVICE_NAME, enum.MOVIES_OF_PUBLISHER_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.MOVIES_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.MOVIES_OF_PUBLISHER_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.MOVIES_OF_PUBLISHER_INTERFACE_NAME, id_index=-1)
 async def fetch_movies_of_publisher(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -462,8 +538,9 @@ async def fetch_movies_of_publisher(tclient, app_version, country, lang, langLis
 # get the episodes of the season
 @timing(RECO_SERVICE_NAME, enum.EPISODES_OF_SEASON_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.EPISODES_OF_SEASON_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.EPISODES_OF_SEASON_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.EPISODES_OF_SEASON_INTERFACE_NAME, id_index=-1)
 async def fetch_episodes_of_season(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -476,8 +553,9 @@ async def fetch_episodes_of_season(tclient, app_version, country, lang, langList
 # get espisodes of the season by a video id
 @timing(RECO_SERVICE_NAME, enum.AROUND_PLAYING_EPISODES_OF_SEASON_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.AROUND_PLAYING_EPISODES_OF_SEASON_INTERFACE_NAME, id_index=-2)
+@related_cache(enum.AROUND_PLAYING_EPISODES_OF_SEASON_INTERFACE_NAME, -6, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId filterId
+@tclient(True)
+@redis.cache_related_card(enum.AROUND_PLAYING_EPISODES_OF_SEASON_INTERFACE_NAME, id_index=-2)
 async def fetch_around_playing_episodes_of_season(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, filterId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -490,8 +568,9 @@ async def fetch_around_playing_episodes_of_season(tclient, app_version, country,
 # get the similar tv shows
 @timing(RECO_SERVICE_NAME, enum.TVSHOWS_SIMILAR_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.TVSHOWS_SIMILAR_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.TVSHOWS_SIMILAR_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.TVSHOWS_SIMILAR_INTERFACE_NAME, id_index=-1)
 async def fetch_related_tv_shows(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -504,8 +583,9 @@ async def fetch_related_tv_shows(tclient, app_version, country, lang, langList,
 # get recommended movies
 @timing(RECO_SERVICE_NAME, enum.MOVIE_SIMILAR_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.MOVIE_SIMILAR_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.MOVIE_SIMILAR_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.MOVIE_SIMILAR_INTERFACE_NAME, id_index=-1)
 async def fecth_similar_movies(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -518,8 +598,9 @@ async def fecth_similar_movies(tclient, app_version, country, lang, langList, us
 # get all the songs of this artist
 @timing(RECO_SERVICE_NAME, enum.LASTEST_SONGS_OF_ARTIST_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.LASTEST_SONGS_OF_ARTIST_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.LASTEST_SONGS_OF_ARTIST_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.LASTEST_SONGS_OF_ARTIST_INTERFACE_NAME, id_index=-1)
 async def fetch_lastest_songs_of_artist(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -533,8 +614,9 @@ async def fetch_lastest_songs_of_artist(tclient, app_version, country, lang, lan
 # get other songs of this album
 @timing(RECO_SERVICE_NAME, enum.SONGS_OF_OTHER_ALBUM_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SONGS_OF_OTHER_ALBUM_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SONGS_OF_OTHER_ALBUM_INTERFACE_NAME, -6, -5, -4, -3, -2, -1) # lang num next type filterId resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SONGS_OF_OTHER_ALBUM_INTERFACE_NAME, id_index=-1)
 async def fetch_other_songs_of_album(tclient, app_version, country, lang, langList, user_id, num, next, type, filterId,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -547,8 +629,9 @@ async def fetch_other_songs_of_album(tclient, app_version, country, lang, langLi
 # get similar songs
 @timing(RECO_SERVICE_NAME, enum.SIMILAR_SONGS_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SIMILAR_SONGS_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SIMILAR_SONGS_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SIMILAR_SONGS_INTERFACE_NAME, id_index=-1)
 async def fetch_similar_songs(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -561,8 +644,9 @@ async def fetch_similar_songs(tclient, app_version, country, lang, langList, use
 # get all the songs of this album
 @timing(RECO_SERVICE_NAME, enum.SONGS_OF_ALBUM_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SONGS_OF_ALBUM_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SONGS_OF_ALBUM_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SONGS_OF_ALBUM_INTERFACE_NAME, id_index=-1)
 async def fetch_songs_of_album(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -575,8 +659,9 @@ async def fetch_songs_of_album(tclient, app_version, country, lang, langList, us
 # get all the songs of this album without paging
 @timing(RECO_SERVICE_NAME, enum.SONGS_OF_THE_ALBUM_NO_PAGING_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SONGS_OF_THE_ALBUM_NO_PAGING_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SONGS_OF_THE_ALBUM_NO_PAGING_INTERFACE_NAME, -3, -2, -1) # lang type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SONGS_OF_THE_ALBUM_NO_PAGING_INTERFACE_NAME, id_index=-1)
 async def fetch_songs_of_album_without_paging(tclient, app_version, country, lang, langList, user_id, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -590,8 +675,9 @@ async def fetch_songs_of_album_without_paging(tclient, app_version, country, lan
 # get related albums
 @timing(RECO_SERVICE_NAME, enum.ALBUMS_SIMILAR_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.ALBUMS_SIMILAR_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.ALBUMS_SIMILAR_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.ALBUMS_SIMILAR_INTERFACE_NAME, id_index=-1)
 async def fetch_related_albums(tclient, app_version, country, lang, langList, user_id, num, next, type, resourceType,
     resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -604,8 +690,9 @@ async def fetch_related_albums(tclient, app_version, country, lang, langList, us
 # get popular songs of the artist
 @timing(RECO_SERVICE_NAME, enum.SONGS_POPULAR_OF_ARTIST_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SONGS_POPULAR_OF_ARTIST_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SONGS_POPULAR_OF_ARTIST_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SONGS_POPULAR_OF_ARTIST_INTERFACE_NAME, id_index=-1)
 async def fetch_popular_songs_of_artist(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -619,8 +706,9 @@ async def fetch_popular_songs_of_artist(tclient, app_version, country, lang, lan
 # get all albums of the artist
 @timing(RECO_SERVICE_NAME, enum.ALBUMS_OF_ARTIST_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.ALBUMS_OF_ARTIST_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.ALBUMS_OF_ARTIST_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.ALBUMS_OF_ARTIST_INTERFACE_NAME, id_index=-1)
 async def fetch_all_albums_of_artist(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -634,8 +722,9 @@ async def fetch_all_albums_of_artist(tclient, app_version, country, lang, langLi
 # get popular albums of the artist
 @timing(RECO_SERVICE_NAME, enum.POPULAR_ALBUMS_OF_ARTIST_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.POPULAR_ALBUMS_OF_ARTIST_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.POPULAR_ALBUMS_OF_ARTIST_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.POPULAR_ALBUMS_OF_ARTIST_INTERFACE_NAME, id_index=-1)
 async def fetch_popular_albums_of_artist(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -649,8 +738,9 @@ async def fetch_popular_albums_of_artist(tclient, app_version, country, lang, la
 # get similar artists
 @timing(RECO_SERVICE_NAME, enum.ARTISTS_SIMILAR_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.ARTISTS_SIMILAR_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.ARTISTS_SIMILAR_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.ARTISTS_SIMILAR_INTERFACE_NAME, id_index=-1)
 async def fetch_similar_artists(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -664,8 +754,9 @@ async def fetch_similar_artists(tclient, app_version, country, lang, langList, u
 # get the seasons of the tv show and sorted by publishe time
 @timing(RECO_SERVICE_NAME, enum.SEASONS_LATEST_OF_TVSHOW_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SEASONS_LATEST_OF_TVSHOW_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SEASONS_LATEST_OF_TVSHOW_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SEASONS_LATEST_OF_TVSHOW_INTERFACE_NAME, id_index=-1)
 async def fetch_lastest_seasons_of_tvshow(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -678,8 +769,9 @@ async def fetch_lastest_seasons_of_tvshow(tclient, app_version, country, lang, l
 # get the first season of the tv show
 @timing(RECO_SERVICE_NAME, enum.FIRST_SEASON_OF_TVSHOW_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.FIRST_SEASON_OF_TVSHOW_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.FIRST_SEASON_OF_TVSHOW_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.FIRST_SEASON_OF_TVSHOW_INTERFACE_NAME, id_index=-1)
 async def fetch_first_season_of_tvshow(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -692,8 +784,9 @@ async def fetch_first_season_of_tvshow(tclient, app_version, country, lang, lang
 # get similar playlists
 @timing(RECO_SERVICE_NAME, enum.SIMILAR_PLAYLISTS_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SIMILAR_PLAYLISTS_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SIMILAR_PLAYLISTS_INTERFACE_NAME, -5, -4, -3, -2, -1) # lang num next type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SIMILAR_PLAYLISTS_INTERFACE_NAME, id_index=-1)
 async def fetch_similar_playlist(tclient, app_version, country, lang, langList, user_id, num, next, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -706,8 +799,9 @@ async def fetch_similar_playlist(tclient, app_version, country, lang, langList,
 # get all songs of playlist
 @timing(RECO_SERVICE_NAME, enum.SONGS_OF_PLAYLIST_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SONGS_OF_PLAYLIST_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SONGS_OF_PLAYLIST_INTERFACE_NAME, -6, -5, -4, -3, -2, -1) # lang num next type filterId resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SONGS_OF_PLAYLIST_INTERFACE_NAME, id_index=-1)
 async def fetch_songs_of_playlist(tclient, app_version, country, lang, langList, user_id, num, next, type, filterId,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -720,8 +814,9 @@ async def fetch_songs_of_playlist(tclient, app_version, country, lang, langList,
 # get all songs of playlist without paging
 @timing(RECO_SERVICE_NAME, enum.SONGS_OF_THE_PLAYLIST_NO_PAGING_INTERFACE_NAME)
 @expand_request
-@tclient(False)
-# @redis.cache_related_card(enum.SONGS_OF_THE_PLAYLIST_NO_PAGING_INTERFACE_NAME, id_index=-1)
+@related_cache(enum.SONGS_OF_THE_PLAYLIST_NO_PAGING_INTERFACE_NAME, -3, -2, -1) # lang type resourceType resourceId
+@tclient(True)
+@redis.cache_related_card(enum.SONGS_OF_THE_PLAYLIST_NO_PAGING_INTERFACE_NAME, id_index=-1)
 async def fetch_songs_of_playlist_without_paging(tclient, app_version, country, lang, langList, user_id, type,
     resourceType, resourceId, log_id=None, app_code=None):
     req = recttypes.Request(
@@ -756,12 +851,22 @@ async def fetch_local_relevant(tclient, app_version, country, lang, langList, us
         logId=log_id)
     return await tclient.recommend(req)
 
+# browse pages are cached by one canonical hash of the filters plus paging
 @timing(RECO_SERVICE_NAME, enum.BROWSE_ITEMS_INTERFACE)
 @expand_request
+@normalize(langList=dedupe, num=clamp(), genres=sort_dedupe, langs=sort_dedupe, singers=sort_dedupe, actors=sort_dedupe,
+           directors=sort_dedupe, release_years=sort_dedupe)
+async def fetch_browse_list(app_version, country, lang, langList, user_id, tab_id, num, type, next,
+    genres, langs, singers, actors, directors, release_years, sort_opt, browse_type, log_id=None, app_code=None):
+    browse_key = canonical_hash(country, lang, langList, tab_id, num, type, next, genres, langs, singers, actors,
+                                directors, release_years, sort_opt, browse_type)
+    return await fetch_browse_page(app_version, country, lang, langList, user_id, tab_id, num, type, next, genres, langs, singers, actors, directors, release_years, sort_opt, browse_type, browse_key, log_id=log_id, app_code=app_code) # pylint: disable=no-value-for-parameter
+
+@MemCache(4096, -1, grace=300, tinylfu=True, weight=2, l2=redis.l2(recttypes.Response, enum.BROWSE_ITEMS_INTERFACE)) # browse_key
 @tclient(True)
 @redis.cache_card(enum.BROWSE_ITEMS_INTERFACE, id_index=-1)
-async def fetch_browse_list(tclient, app_version, country, lang, langList, user_id, tab_id, num, type, next,
-    genres, langs, singers, actors, directors, release_years, sort_opt, browse_type, log_id=None, app_code=None):
+async def fetch_browse_page(tclient, app_version, country, lang, langList, user_id, tab_id, num, type, next,
+    genres, langs, singers, actors, directors, release_years, sort_opt, browse_type, browse_key, log_id=None, app_code=None):
     req = recttypes.Request(
         userId=user_id, country=country, language=lang, languageList=langList, clientVersion=app_code, tabId=tab_id,
         interfaceName=enum.BROWSE_ITEMS_INTERFACE, resourceType=browse_type, num=num, type=type, finalId=next,
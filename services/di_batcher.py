@@ -0,0 +1,103 @@
+import asyncio
+from conf import conf
+from utils import log, metrics, deadline
+from .thrift.di import ttypes as dittypes
+from .redis_client import redis
+
+WINDOW = 0.005
+MAX_SIZE = 100
+
+
+class DIBatcher:
+    '''merge the IdsWithType lookups of concurrent requests into one getDetail call'''
+
+    def __init__(self, fetch):
+        cfg = getattr(conf, 'DI_BATCH', {})
+        self._fetch = fetch
+        self._window = cfg.get('WINDOW', WINDOW)
+        self._max_size = cfg.get('MAX_SIZE', MAX_SIZE)
+        self._pending = {}  # typ -> {id: True}, keeps the order of ids
+        self._waiters = []
+        self._size = 0
+        self._timer = None
+
+    async def get(self, idts, log_id=None):
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        self._waiters.append((waiter, idts, log_id, deadline.current()))
+
+        for idt in idts:
+            ids = self._pending.setdefault(idt.type, {})
+            for i in idt.ids:
+                if i in ids:
+                    metrics.incr('di_batch:dedup')
+                    continue
+
+                ids[i] = True
+                self._size += 1
+
+        if self._size >= self._max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), deadline.budget('DI:batch'))
+        except deadline.DeadlineExceeded:
+            return None
+        except asyncio.TimeoutError:
+            deadline.exceeded('DI:batch')
+            return None
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, waiters = self._pending, self._waiters
+        self._pending, self._waiters, self._size = {}, [], 0
+
+        if len(waiters) > 0:
+            asyncio.ensure_future(self._send(pending, waiters))
+
+    async def _send(self, pending, waiters):
+        idwts = [dittypes.IdsWithType(ids=list(ids), type=typ) for typ, ids in pending.items()]
+        metrics.incr('di_batch:batches')
+        metrics.incr('di_batch:callers', len(waiters))
+        metrics.incr('di_batch:ids', sum(len(ids) for ids in pending.values()))
+
+        # the batch runs until the latest deadline of its callers
+        deadlines = [w[3] for w in waiters]
+        deadline.reset(None if None in deadlines else max(deadlines))
+
+        try:
+            res = await self._fetch(idwts, log_id=waiters[0][2])
+            if res is not None:
+                self._dispatch(res, pending, waiters)
+        except Exception as e:
+            log.print_excp(e)
+        finally:
+            for waiter, *_ in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    # 把结果按各自请求的ids分发回去
+    def _dispatch(self, res, pending, waiters):
+        # only types DI answered for, a type it left out must not look like one without items
+        returned = set(res.typeList or [])
+        items = {}
+        for typ in pending:
+            if typ in returned:
+                items[typ] = {redis.di_id(typ, it): it for it in redis.di_getlist(res, typ)}
+
+        for waiter, idts, *_ in waiters:
+            if waiter.done():
+                continue
+
+            idts = [idt for idt in idts if idt.type in items]
+            obj = dittypes.DIResponse(typeList=[idt.type for idt in idts])
+            for idt in idts:
+                typ_items = items.get(idt.type, {})
+                redis.di_setlist(obj, idt.type, [typ_items[i] for i in idt.ids if i in typ_items])
+
+            waiter.set_result(obj)
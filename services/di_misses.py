@@ -0,0 +1,64 @@
+from time import time
+from conf import conf
+from utils import metrics
+
+TTL = 60
+PRUNE_INTERVAL = 60
+MAX_IDS = 100000
+
+# stored in redis in place of a DI object for an id that DI did not return
+MISSING = b''
+
+
+class DIMisses:
+    '''ids DI does not return, answered without asking DI again
+
+    misses are stored in redis for TTL seconds, which all workers see, and kept locally with their expiry,
+    so a resource created later is found again after at most TTL; expired misses are pruned every PRUNE_INTERVAL
+    '''
+
+    def __init__(self):
+        cfg = getattr(conf, 'DI_NEGATIVE', {})
+        self.ttl = cfg.get('TTL', TTL)
+        self.prune_interval = cfg.get('PRUNE_INTERVAL', PRUNE_INTERVAL)
+        self.max_ids = cfg.get('MAX_IDS', MAX_IDS)
+        self._missing = {}  # key -> expire_at
+        self._pruned_at = 0
+
+        metrics.gauge('di_negative:ids', lambda: len(self._missing))
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _key(self, typ, version, id):
+        return f'{typ}:{version}:{id}'
+
+    def add(self, typ, version, ids):
+        expire_at = time() + self.ttl
+        for id in ids:
+            if len(self._missing) >= self.max_ids:
+                break
+
+            self._missing[self._key(typ, version, id)] = expire_at
+
+    def _prune(self, now):
+        self._missing = {k: v for k, v in self._missing.items() if v > now}
+        self._pruned_at = now
+
+    # ids of typ that are not known to be missing
+    def filter(self, typ, version, ids):
+        if not self.enabled:
+            return ids
+
+        now = time()
+        if now - self._pruned_at >= self.prune_interval:
+            self._prune(now)
+
+        if len(self._missing) == 0:
+            return ids
+
+        res = [id for id in ids if self._missing.get(self._key(typ, version, id), 0) <= now]
+        if len(res) < len(ids):
+            metrics.incr('di_negative:local_ids', len(ids) - len(res))
+        return res
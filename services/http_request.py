@@ -4,6 +4,7 @@ from time import time
 from aiohttp import ClientSession, ClientTimeout
 from conf import enum
 from utils.log import logger, print_excp
+from utils import deadline
 
 session: ClientSession = None
 cdn_addr_task = None
@@ -33,7 +34,10 @@ def timing(f):
 
         try:
             res = await f(*args, **kwargs)
-        except Exception:
+        except Exception as e:
+            # a deadline already spent before the call is counted by request_timeout()
+            if isinstance(e, asyncio.TimeoutError):
+                deadline.exceeded('HTTP')
             stop = time()
             ms = int(1000 * (stop - start))
             logger.error(f'{ms}ms for http error {f.__name__}')
@@ -48,9 +52,13 @@ def timing(f):
     return g
 
 
+def request_timeout():
+    return ClientTimeout(total=deadline.budget('HTTP', HTTP_TIMEOUT))
+
+
 # POST REQUEST
 async def post_request(url, body=None, data=None, headers=None, need_res=True):
-    async with session.post(url, json=body, data=data, headers=headers) as resp:
+    async with session.post(url, json=body, data=data, headers=headers, timeout=request_timeout()) as resp:
         if resp.status != 200:
             logger.error(f'http status {resp.status} for {url}')
 
@@ -62,7 +70,7 @@ async def post_request(url, body=None, data=None, headers=None, need_res=True):
 
 # GET REQUEST
 async def get_request(url, params=None, headers=None):
-    async with session.get(url, params=params, headers=headers) as resp:
+    async with session.get(url, params=params, headers=headers, timeout=request_timeout()) as resp:
         if resp.status != 200:
             logger.error(f'http status {resp.status} for {url}')
 
@@ -0,0 +1,194 @@
+import sys
+from collections import OrderedDict
+from time import time
+from conf import conf
+from utils import metrics
+
+BYTES = 512 * 1024 * 1024
+RECONCILE_INTERVAL = 1
+MAX_DEPTH = 20
+SAMPLE_EVERY = 16
+SIZE_ALPHA = 0.2
+
+
+# rough deep size of a thrift object, counting every struct, container and string it holds
+def estimate_size(obj, seen=None, depth=0):
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or depth > MAX_DEPTH:
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen, depth + 1) + estimate_size(v, seen, depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, seen, depth + 1) for v in obj)
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(obj.__dict__, seen, depth + 1)
+
+    return size
+
+
+# what values of about the same size share: their type and how many items they hold one level down
+def shape(obj):
+    if isinstance(obj, (list, tuple, set, frozenset, dict)):
+        return type(obj), len(obj)
+
+    fields = getattr(obj, '__dict__', None)
+    if fields is None:
+        return type(obj), 0
+
+    return type(obj), sum(len(v) for v in fields.values() if isinstance(v, (list, tuple, set, dict)))
+
+
+class SizeSampler:
+    '''deep size of values by shape, measured on one of every SAMPLE_EVERY stores and averaged in between'''
+
+    def __init__(self, every=SAMPLE_EVERY):
+        self.every = every
+        self.shapes = {}  # shape -> [estimate, stores]
+
+    def size(self, value):
+        key = shape(value)
+        entry = self.shapes.get(key)
+        if entry is None:
+            entry = self.shapes[key] = [estimate_size(value), 0]
+        elif entry[1] % self.every == 0:
+            entry[0] = entry[0] * (1 - SIZE_ALPHA) + estimate_size(value) * SIZE_ALPHA
+
+        entry[1] += 1
+        return int(entry[0])
+
+
+class Account:
+    '''bytes of the entries of one MemCache, in least recently used order'''
+
+    def __init__(self, budget, name, store, weight):
+        self.budget = budget
+        self.name = name
+        self.store = store
+        self.weight = weight
+        self.bytes = 0
+        self.records = OrderedDict()  # key -> (size, last access)
+        self.reconciled_at = 0
+        self.sampler = SizeSampler(budget.sample_every)
+
+    def share(self):
+        return self.budget.total * self.weight / self.budget.weights()
+
+    # called after the store, a key the store did not accept (rejected by TinyLFU) is not charged
+    def set(self, key, value):
+        now = time()
+        # expired entries are not reported by the stores, at most once per RECONCILE_INTERVAL they are looked for
+        self.reconcile(now)
+        old = self.records.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0]
+
+        if key not in self.store:
+            return
+
+        size = self.sampler.size(value)
+        self.records[key] = (size, now)
+        self.bytes += size
+        self.budget.charged()
+
+    def touch(self, key):
+        record = self.records.get(key)
+        if record is not None:
+            self.records[key] = (record[0], time())
+            self.records.move_to_end(key)
+
+    def drop(self, key):
+        record = self.records.pop(key, None)
+        if record is not None:
+            self.bytes -= record[0]
+
+    # forget entries the cache itself dropped by expiry
+    def reconcile(self, now):
+        if now - self.reconciled_at < RECONCILE_INTERVAL:
+            return
+
+        for key in [k for k in self.records if k not in self.store]:
+            self.drop(key)
+        self.reconciled_at = now
+
+    # the account without the entries that expired since the last reconcile, for the gauges
+    def current(self):
+        self.reconcile(time())
+        return self
+
+    def evict(self, key):
+        self.drop(key)
+        try:
+            del self.store[key]
+        except KeyError:
+            pass
+        metrics.incr(f'memcache:{self.name}:budget_evict')
+
+
+class MemoryBudget:
+    '''one byte budget shared by all MemCache instances of the process
+
+    every cache may use its weighted share, when the total is over budget the least recently used entry
+    of some cache is evicted, the one scoring highest by size * idle seconds * how far its cache is over its share
+    '''
+
+    def __init__(self):
+        cfg = getattr(conf, 'MEMCACHE_BUDGET', {})
+        self.total = cfg.get('BYTES', BYTES)
+        self.sample_every = cfg.get('SAMPLE_EVERY', SAMPLE_EVERY)
+        self.accounts = []
+
+        metrics.gauge('memcache:budget:total', lambda: self.total)
+        metrics.gauge('memcache:budget:used', self.used)
+
+    def register(self, name, store, weight=1):
+        account = Account(self, name, store, weight)
+        self.accounts.append(account)
+
+        metrics.gauge(f'memcache:{name}:bytes', lambda: account.current().bytes)
+        metrics.gauge(f'memcache:{name}:entries', lambda: len(account.current().records))
+        return account
+
+    def weights(self):
+        return sum(a.weight for a in self.accounts)
+
+    def used(self):
+        return sum(a.bytes for a in self.accounts)
+
+    def charged(self):
+        if self.total <= 0 or self.used() <= self.total:
+            return
+
+        now = time()
+        for account in self.accounts:
+            account.reconcile(now)
+
+        while self.used() > self.total:
+            victim = self._victim(now)
+            if victim is None:
+                break
+            account, key = victim
+            account.evict(key)
+
+    def _victim(self, now):
+        best, best_score = None, -1
+        for account in self.accounts:
+            if len(account.records) == 0:
+                continue
+
+            key = next(iter(account.records))
+            size, last_access = account.records[key]
+            score = size * (now - last_access + 1) * account.bytes / account.share()
+            if score > best_score:
+                best, best_score = (account, key), score
+
+        return best
+
+
+budget = MemoryBudget()
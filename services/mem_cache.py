@@ -1,30 +1,144 @@
+import asyncio
+from math import log
+from random import random
 from time import time
+from functools import wraps
 from cachetools import TTLCache
 from cachetools.keys import hashkey
 from conf import conf
+from utils import metrics, deadline, downgrade
+from utils.tinylfu import TinyLFUCache
+from .mem_budget import budget
 
 TTL = 300 if conf.IS_PROD else 60
 
+
+class ReportingTTLCache(TTLCache):
+    '''TTLCache which reports the keys it evicts for its capacity, like TinyLFUCache.on_evict'''
+
+    on_evict = None
+
+    def popitem(self):
+        key, value = super().popitem()
+        if self.on_evict is not None:
+            self.on_evict(key)
+        return key, value
+
+# grace: seconds an expired value is still served while one background task refreshes it
+# beta: > 0 enables probabilistic refresh before expiry, bigger means earlier
+# l2: a shared second tier (redis.l2) consulted on a miss before calling f
+# tinylfu: admit new keys by access frequency instead of plain LRU, for caches of many one-hit keys
+# weight: share of the process wide byte budget (mem_budget), relative to the other caches
+# ttl: seconds a value is fresh, TTL by default
 class MemCache:
-    def __init__(self, capacity, *indices):
-        self._cache = TTLCache(capacity, TTL, timer=time)
+    def __init__(self, capacity, *indices, grace=0, beta=0, l2=None, tinylfu=False, weight=1, ttl=TTL):
+        cache_cls = TinyLFUCache if tinylfu else ReportingTTLCache
+        self._cache = cache_cls(capacity, ttl + grace, timer=time)
+        self._ttl = ttl
         self._indices = indices
+        self._grace = grace
+        self._beta = beta
+        self._l2 = l2
+        self._weight = weight
+        self._account = None
+        # key -> future of the call in flight, shared by concurrent misses
+        self._inflight = {}
 
     def __call__(self, f):
-        async def g(*args, **kwargs):
-            key = hashkey(*[';'.join(args[idx]) if isinstance(args[idx], list) else args[idx] for idx in self._indices])
-            res = self._cache.get(key)
-            if res is None:
-                res = await f(*args, **kwargs)
-                nocache = False
-                try:
-                    nocache = res.disableCache
-                except:
-                    pass
-
-                if not nocache:
-                    self._cache[key] = res
+        name = f.__name__
+        self._account = budget.register(name, self._cache, self._weight)
+        # keys the cache drops for its capacity are released at once, expired ones by the account's reconcile
+        self._cache.on_evict = self._account.drop
+        if isinstance(self._cache, TinyLFUCache):
+            metrics.gauge(f'memcache:{name}:rejected', lambda: self._cache.rejected)
+
+        async def fetch(key, args, kwargs, use_l2):
+            start = time()
+            fetched = False
+            try:
+                res = None
+                if use_l2 and self._l2 is not None:
+                    res = await self._l2.get(key)
+                    metrics.incr(f'memcache:{name}:l2_hit' if res is not None else f'memcache:{name}:l2_miss')
+
+                if res is None:
+                    downgrade.clear()
+                    res = await f(*args, **kwargs)
+                    # downgrade data from redis is not fresh, it must not be shared through l2
+                    fetched = not downgrade.happened()
+            finally:
+                # an overlapping fetch of key may have taken the slot, leave its entry alone
+                if self._inflight.get(key) is asyncio.current_task():
+                    del self._inflight[key]
+
+            nocache = False
+            try:
+                nocache = res.disableCache
+            except:
+                pass
+
+            # a None result never replaces the value being served
+            if res is not None and not nocache:
+                now = time()
+                self._cache[key] = (res, now + self._ttl, now - start)
+                self._account.set(key, res)
+                if fetched and self._l2 is not None:
+                    deadline.detach(self._l2.set(key, res))
 
+            # disableCache results are still shared with the calls waiting on this one
             return res
 
+        # the fetch runs in its own task, shared by the concurrent misses of key,
+        # so a cancelled leader (client gone, deadline) does not cancel the calls waiting on it;
+        # the task is in _inflight before the caller yields, so no other call of key starts another one
+        def start(key, args, kwargs, use_l2=True, detached=False):
+            cor = fetch(key, args, kwargs, use_l2)
+            task = self._inflight[key] = deadline.detach(cor) if detached else asyncio.ensure_future(cor)
+            # mark a failure as retrieved, when nobody is left waiting for it
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return task
+
+        async def load(key, args, kwargs):
+            return await asyncio.shield(start(key, args, kwargs))
+
+        # the refresh is not part of the request which triggered it, and goes to the service to keep l2 fresh too
+        def refresh_later(key, args, kwargs):
+            if key not in self._inflight:
+                metrics.incr(f'memcache:{name}:refresh')
+                start(key, args, kwargs, use_l2=False, detached=True)
+
+        def cache_key(args):
+            return hashkey(*[';'.join(args[idx]) if isinstance(args[idx], list) else args[idx] for idx in self._indices])
+
+        @wraps(f)
+        async def g(*args, **kwargs):
+            key = cache_key(args)
+            entry = self._cache.get(key)
+            if entry is not None:
+                res, expire_at, delta = entry
+                now = time()
+                self._account.touch(key)
+                if now < expire_at:
+                    metrics.incr(f'memcache:{name}:hit')
+                    if self._beta > 0 and now - delta * self._beta * log(1 - random()) >= expire_at:
+                        metrics.incr(f'memcache:{name}:early_refresh')
+                        refresh_later(key, args, kwargs)
+                    return res
+
+                if self._grace > 0:
+                    metrics.incr(f'memcache:{name}:stale')
+                    refresh_later(key, args, kwargs)
+                    return res
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                metrics.incr(f'memcache:{name}:coalesced')
+                # shield so that a cancelled follower does not cancel the shared call
+                return await asyncio.shield(inflight)
+
+            metrics.incr(f'memcache:{name}:miss')
+            return await load(key, args, kwargs)
+
+        # wraps copies it to the decorators above, cache_keys.normalize counts keys with it
+        g.cache_key = cache_key
         return g
@@ -0,0 +1,160 @@
+import inspect
+from functools import wraps
+from random import random
+from conf import conf
+from utils import logger, metrics, deadline, print_excp
+
+MAX_CONCURRENCY = 16
+MIN_HIT_RATE = 0.2
+MIN_SAMPLES = 20
+# share of prefetches still done for a card below MIN_HIT_RATE, so that it can recover
+PROBE_RATE = 0.05
+DECAY_SAMPLES = 200
+MAX_PENDING = 10000
+# leading parameters the client decorators pass in, callers of the decorated function do not
+INJECTED = ('tclient', 'diclient')
+
+
+def config():
+    return getattr(conf, 'PREFETCH', {})
+
+
+class CardStats:
+    def __init__(self):
+        self.prefetched = 0
+        self.used = 0
+
+    def rate(self):
+        return self.used / self.prefetched if self.prefetched else 0
+
+    def record_prefetch(self):
+        self.prefetched += 1
+        # halve old samples, so the rate follows what users do now
+        if self.prefetched >= DECAY_SAMPLES:
+            self.prefetched //= 2
+            self.used //= 2
+
+
+class Prefetcher:
+    '''fetches the next page of a card in the background after a page is served, so that scrolling hits MemCache
+
+    prefetches run at most MAX_CONCURRENCY at a time in the process, and cards whose prefetched pages are rarely
+    requested (hit rate below MIN_HIT_RATE after MIN_SAMPLES) are only probed now and then
+    '''
+
+    def __init__(self):
+        self.inflight = 0
+        self.stats = {}  # (fn name, card) -> CardStats
+        self.pending = {}  # (fn name, card, cursor) -> True, prefetched pages not requested yet
+
+        metrics.gauge('prefetch:inflight', lambda: self.inflight)
+
+    @property
+    def enabled(self):
+        return config().get('ENABLED', False)
+
+    def card_stats(self, name, card):
+        stats = self.stats.get((name, card))
+        if stats is None:
+            stats = self.stats[(name, card)] = CardStats()
+        return stats
+
+    # a request for a page which was prefetched
+    def requested(self, name, card, cursor):
+        if self.pending.pop((name, card, cursor), None) is not None:
+            self.card_stats(name, card).used += 1
+            metrics.incr(f'prefetch:{name}:used')
+
+    def wanted(self, name, card):
+        cfg = config()
+        if self.inflight >= cfg.get('MAX_CONCURRENCY', MAX_CONCURRENCY):
+            metrics.incr(f'prefetch:{name}:busy')
+            return False
+
+        stats = self.card_stats(name, card)
+        if stats.prefetched >= cfg.get('MIN_SAMPLES', MIN_SAMPLES) and stats.rate() < cfg.get('MIN_HIT_RATE', MIN_HIT_RATE):
+            if random() >= PROBE_RATE:
+                metrics.incr(f'prefetch:{name}:cold')
+                return False
+
+        return True
+
+    def start(self, f, name, card, cursor, args, kwargs):
+        if len(self.pending) >= MAX_PENDING:
+            self.pending.clear()
+
+        self.pending[(name, card, cursor)] = True
+        self.card_stats(name, card).record_prefetch()
+        self.inflight += 1
+        metrics.incr(f'prefetch:{name}:started')
+        logger.debug(f'prefetch {name} card {card} cursor {cursor}')
+        deadline.detach(self._run(f, args, kwargs))
+
+    async def _run(self, f, args, kwargs):
+        try:
+            await f(*args, **kwargs)
+        except Exception as e:
+            print_excp(e)
+        finally:
+            self.inflight -= 1
+
+
+prefetcher = Prefetcher()
+
+
+# the signature callers see, without the parameters the client decorators inject
+def call_signature(f):
+    sig = inspect.signature(f)
+    params = list(sig.parameters.values())
+    while params and params[0].name in INJECTED:
+        params.pop(0)
+    return sig.replace(parameters=params)
+
+
+# after a page is served, call f again for the next page: cursor is the argument of the page cursor,
+# card the argument naming the card, next_of gets the next cursor from a result,
+# overrides are other arguments the next page is requested with, e.g. type=1
+def prefetch(cursor, card, next_of, **overrides):
+    def wrapper(f):
+        name = f.__name__
+        sig = call_signature(f)
+        positions = {n: i for i, n in enumerate(sig.parameters)}
+
+        @wraps(f)
+        async def g(*args, **kwargs):
+            if not prefetcher.enabled:
+                return await f(*args, **kwargs)
+
+            # arguments by name, whether they came positionally or as keywords
+            bound = sig.bind_partial(*args, **kwargs)
+            page_card = bound.arguments.get(card)
+            prefetcher.requested(name, page_card, bound.arguments.get(cursor))
+
+            res = await f(*args, **kwargs)
+            if res is None:
+                return res
+
+            try:
+                next_cursor = next_of(res)
+            except Exception as e:
+                print_excp(e)
+                next_cursor = None
+
+            if not next_cursor:
+                # the last page, or a response without the cursor field next_of reads
+                metrics.incr(f'prefetch:{name}:no_cursor')
+            elif prefetcher.wanted(name, page_card):
+                # the next call keeps the shape of this one, the caches below find their key arguments by position
+                next_args, next_kwargs = list(args), dict(kwargs)
+                for n, value in {cursor: next_cursor, **overrides}.items():
+                    if positions[n] < len(args):
+                        next_args[positions[n]] = value
+                    else:
+                        next_kwargs[n] = value
+                prefetcher.start(f, name, page_card, next_cursor, next_args, next_kwargs)
+
+            return res
+
+        return g
+
+    return wrapper
@@ -1,16 +1,57 @@
 import asyncio
+from collections import namedtuple
+from functools import wraps
 import aioredis
+from cachetools import TTLCache
 import ujson
-import lz4.frame
 from conf import conf
-from thrift.protocol.TCompactProtocol import TCompactProtocol
-from thrift.transport.TTransport import TMemoryBuffer
-from utils import logger, log, print_excp
-from random import random
+from time import time
+from utils import logger, log, print_excp, deadline, metrics
+from random import random, sample
+from .thrift.recommend import ttypes as recttypes
+from .thrift.di import ttypes as dittypes
+from .write_behind import WriteBehind
+from .redis_scripts import SCRIPTS
+from .version_registry import VersionRegistry
+from .di_misses import DIMisses, MISSING
+from . import codec
 
 DI_TTL = 5 * 60 if conf.IS_PROD else 60
 RECO_TTL = 7 * 24 * 3600 if conf.IS_PROD else 60
-RELATED_CARD_TTL = 0
+RELATED_CARD_TTL = 24 * 3600 if conf.IS_PROD else 60
+RELATED_CARD_SAMPLES = 5
+L2_TTL = 10 * 60 if conf.IS_PROD else 60
+DI_LOCAL_CAPACITY = 10000
+HEALTH_INTERVAL = 5
+HEALTH_TIMEOUT = 1
+LATENCY_ALPHA = 0.3
+
+
+# cache config of a related card interface, conf.RELATED_CARD[interfaceName] over conf.RELATED_CARD['default']
+def related_card_conf(interfaceName):
+    cfgs = getattr(conf, 'RELATED_CARD', {})
+    return {
+        'CAPACITY': 4096,
+        'TTL': 300,
+        'REDIS_TTL': RELATED_CARD_TTL,
+        'SAMPLES': RELATED_CARD_SAMPLES,
+        **cfgs.get('default', {}),
+        **cfgs.get(interfaceName, {})
+    }
+
+
+DIType = namedtuple('DIType', ['creator', 'cls_name', 'list_name', 'is_video'])
+
+
+class TimedPool(aioredis.ConnectionsPool):
+    '''records how long callers wait for a free connection'''
+
+    async def acquire(self, command=None, args=()):
+        start = time()
+        try:
+            return await super().acquire(command, args)
+        finally:
+            metrics.observe('redis:pool_wait', 1000 * (time() - start))
 
 
 # noinspection PyMethodMayBeStatic
@@ -21,16 +62,59 @@ class RedisClient:
         self.max = len(conf.REDIS['addresses'])
         self.di_versions = {}
         self.reco_versions = {}
+        # health of each replica, failed ones are out of read rotation
+        self.up = [True] * self.max
+        self.latency = [0.0] * self.max
+        self.health_task = None
+        self.writer = WriteBehind(self)
+        self.registry = VersionRegistry(self)
+        self.di_misses = DIMisses()
+        # decoded DI objects of hot ids, keyed by typ:version:id, redis only sees the long tail
+        di_local = getattr(conf, 'DI_LOCAL', {})
+        self.di_local = TTLCache(di_local.get('CAPACITY', DI_LOCAL_CAPACITY), min(di_local.get('TTL', DI_TTL), DI_TTL))
+        metrics.gauge('di_local:size', lambda: len(self.di_local))
+        self._di_types = None
 
     async def prepare_conn(self):
         addresses = conf.REDIS['addresses']
-        password = conf.REDIS.get('password')
+        password = conf.REDIS.get('password') or None
+        minsize = conf.REDIS.get('minsize', 1)
+        maxsize = conf.REDIS.get('maxsize', 8)
         self.redis_pool = await asyncio.gather(*[
-            aioredis.create_redis_pool(addresses[i], minsize=1, maxsize=1) for i in range(self.max)
+            aioredis.create_redis_pool(addresses[i], password=password, minsize=minsize, maxsize=maxsize,
+                                       pool_cls=TimedPool) for i in range(self.max)
         ])
+
+        for i, pool in enumerate(self.redis_pool):
+            metrics.gauge(f'redis:{i}:size', lambda pool=pool: pool.size)
+            metrics.gauge(f'redis:{i}:freesize', lambda pool=pool: pool.freesize)
+            metrics.gauge(f'redis:{i}:up', lambda i=i: int(self.up[i]))
+            metrics.gauge(f'redis:{i}:latency_ms', lambda i=i: self.latency[i])
+
+        self.health_task = asyncio.ensure_future(self.health_check())
+
+        # not fatal, the write-behind flush loads the scripts again on NOSCRIPT
+        try:
+            await self.load_scripts()
+        except Exception as e:
+            logger.error(f'[REDIS] loading scripts failed: {e!r}')
+
+        await self.registry.start()
         logger.info('RedisClient init done')
 
+    # scripts run on the write master and are called by sha
+    async def load_scripts(self):
+        redis = await self.connect(write=True)
+        for script in SCRIPTS:
+            await redis.script_load(script.source)
+
     async def close(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+
+        await self.registry.close()
+        await self.writer.close()
+
         for i in self.redis_pool:
             try:
                 i.close()
@@ -38,29 +122,83 @@ class RedisClient:
             except Exception as e:
                 print_excp(e)
 
+    async def health_check(self):
+        interval = conf.REDIS.get('health_interval', HEALTH_INTERVAL)
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(*[self.ping(i) for i in range(len(self.redis_pool))])
+
+    async def ping(self, i):
+        start = time()
+        try:
+            await asyncio.wait_for(self.redis_pool[i].ping(), HEALTH_TIMEOUT)
+        except Exception as e:
+            metrics.incr(f'redis:{i}:health_fail')
+            if self.up[i]:
+                logger.warning(f'[REDIS] replica {i} is down: {e!r}')
+            self.up[i] = False
+            return
+
+        ms = 1000 * (time() - start)
+        self.latency[i] = ms if not self.up[i] else self.latency[i] * (1 - LATENCY_ALPHA) + ms * LATENCY_ALPHA
+        if not self.up[i]:
+            logger.info(f'[REDIS] replica {i} is up')
+        self.up[i] = True
+
     async def connect(self, write=False):
         if write:
             return self.redis_pool[0]
-        else:
+
+        ups = [i for i in range(len(self.redis_pool)) if self.up[i]]
+        if len(ups) == 0:
+            # no healthy replica known, fall back to round robin
             self.current = (self.current + 1) % self.max
             return self.redis_pool[self.current]
 
+        if len(ups) == 1:
+            return self.redis_pool[ups[0]]
+
+        # pick the faster one of two random healthy replicas
+        a, b = sample(ups, 2)
+        return self.redis_pool[a if self.latency[a] <= self.latency[b] else b]
+
+    # redis calls are bounded by what is left of the request deadline
+    async def call(self, cor):
+        try:
+            timeout = deadline.budget('REDIS')
+        except deadline.DeadlineExceeded:
+            if asyncio.iscoroutine(cor):
+                cor.close()
+            raise
+
+        try:
+            return await asyncio.wait_for(cor, timeout)
+        except asyncio.TimeoutError:
+            deadline.exceeded('REDIS')
+            raise
+
     def lucky(self):
         return random() < conf.REDIS['probability']
 
     def get_di_version(self, typ):
         return self.di_versions.get(self.di_cls_name(typ), {}).get('version', 0)
 
-    def get_reco_version(self, creator):
-        return self.reco_versions.get(creator.__name__, {}).get('version', 0)
+    # bumping either the response type or the interface moves to new keys
+    def get_reco_version(self, creator, interfaceName=None):
+        version = self.reco_versions.get(creator.__name__, {}).get('version', 0)
+        if interfaceName is not None:
+            version += self.reco_versions.get(interfaceName, {}).get('version', 0)
+        return version
 
-    def cache_list(self, creator, interfaceName, id_index=None):
-        version = self.get_reco_version(creator)
+    def l2(self, creator, interfaceName, many=False):
+        return RedisL2(self, creator, interfaceName, many)
 
+    def cache_list(self, creator, interfaceName, id_index=None):
         def wrapper(f):
+            @wraps(f)
             async def g(*args, **kwargs):
                 service = args[0]
-                key = f'{interfaceName}:{version}'
+                key = f'{interfaceName}:{self.get_reco_version(creator, interfaceName)}'
                 if id_index is not None:
                     key = f'{key}:{args[id_index]}'
                 objs = []
@@ -69,17 +207,8 @@ class RedisClient:
                     # recommend service is down, resort to redis
                     try:
                         redis = await self.connect()
-                        robjs = await redis.lrange(key, 0, -1)
-                        robjs = robjs or []
-                        for robj in robjs:
-                            if robj is None:
-                                continue
-
-                            obj = creator()
-                            mobj = TMemoryBuffer(lz4.frame.decompress(robj))
-                            cobj = TCompactProtocol(mobj)
-                            obj.read(cobj)
-                            objs.append(obj)
+                        robjs = await self.call(redis.lrange(key, 0, -1))
+                        objs = await codec.decode_list(creator, robjs or [])
 
                         logger.debug(f'[REDIS] Get list of {key} from cache')
                     except Exception as e:
@@ -89,22 +218,7 @@ class RedisClient:
                     # save obj to redis randomly
                     if self.lucky() and objs is not None and len(objs) > 0:
                         try:
-                            redis = await self.connect(True)
-                            vals = []
-                            for obj in objs:
-                                mobj = TMemoryBuffer()
-                                cobj = TCompactProtocol(mobj)
-                                obj.write(cobj)
-                                vals.append(lz4.frame.compress(mobj.getvalue()))
-
-                            if len(vals) > 0:
-                                tr = redis.multi_exec()
-                                tr.ltrim(key, 1, 0)
-                                tr.rpush(key, *vals)
-                                tr.expire(key, RECO_TTL)
-
-                                await tr.execute()
-                                logger.debug(f'[REDIS] Set list of {key} to cache')
+                            self.writer.replace_list(key, objs, RECO_TTL)
                         except Exception as e:
                             log.print_excp(e)
 
@@ -114,10 +228,9 @@ class RedisClient:
 
         return wrapper
 
-    async def cache_set(self, f, creator, prefix, id_index, *args, **kwargs):
-        capacity = 10
+    async def cache_set(self, f, creator, interfaceName, prefix, id_index, *args, capacity=10, ttl=RECO_TTL, **kwargs):
         service = args[0]
-        version = self.get_reco_version(creator)
+        version = self.get_reco_version(creator, interfaceName)
         key = f'{prefix}:{version}'
         if id_index is not None:
             key = f'{key}:{args[id_index]}'
@@ -127,12 +240,9 @@ class RedisClient:
             # recommend service is down, fetch one from redis randomly
             try:
                 redis = await self.connect()
-                robj = await redis.srandmember(key)
+                robj = await self.call(redis.srandmember(key))
                 if robj is not None:
-                    obj = creator()
-                    mobj = TMemoryBuffer(lz4.frame.decompress(robj))
-                    cobj = TCompactProtocol(mobj)
-                    obj.read(cobj)
+                    obj = (await codec.decode_list(creator, [robj]))[0]
 
                     logger.debug(f'[REDIS] Get Response obj of {key} from cache')
             except Exception as e:
@@ -143,20 +253,7 @@ class RedisClient:
             # save obj to redis randomly
             if self.lucky() and obj is not None:
                 try:
-                    redis = await self.connect(True)
-                    # del some randomly when total number is more than {capacity}
-                    total = await redis.scard(key)
-                    if total > capacity * 1.25:
-                        await redis.execute('spop', key, int(total - capacity * 0.75))
-                    else:
-                        tr = redis.multi_exec()
-                        mobj = TMemoryBuffer()
-                        cobj = TCompactProtocol(mobj)
-                        obj.write(cobj)
-                        tr.sadd(key, lz4.frame.compress(mobj.getvalue()))
-                        tr.expire(key, RECO_TTL)
-                        await tr.execute()
-                        logger.debug(f'[REDIS] Set Response obj of {key} to cache')
+                    self.writer.add_to_set(key, obj, ttl, capacity)
                 except Exception as e:
                     log.print_excp(e)
 
@@ -168,8 +265,10 @@ class RedisClient:
                 objs = await f(*args, **kwargs)
                 return objs[0] if len(objs) > 0 else None
 
+            @wraps(f)
             async def g(*args, **kwargs):
-                obj = await self.cache_set(fn, recttypes.Tabs, f'tab:{interfaceName}', id_index, *args, **kwargs)
+                obj = await self.cache_set(fn, recttypes.Tabs, interfaceName, f'tab:{interfaceName}', id_index,
+                                           *args, **kwargs)
                 return [obj] if obj is not None else []
 
             return g
@@ -178,8 +277,23 @@ class RedisClient:
 
     def cache_card(self, interfaceName, id_index=None):
         def wrapper(f):
+            @wraps(f)
             async def g(*args, **kwargs):
-                return await self.cache_set(f, recttypes.Response, interfaceName, id_index, *args, **kwargs)
+                return await self.cache_set(f, recttypes.Response, interfaceName, interfaceName, id_index, *args, **kwargs)
+
+            return g
+
+        return wrapper
+
+    # per resource sample set of related card responses, served when the recommend service is down
+    def cache_related_card(self, interfaceName, id_index=-1):
+        cfg = related_card_conf(interfaceName)
+
+        def wrapper(f):
+            @wraps(f)
+            async def g(*args, **kwargs):
+                return await self.cache_set(f, recttypes.Response, interfaceName, f'related:{interfaceName}', id_index,
+                                            *args, capacity=cfg['SAMPLES'], ttl=cfg['REDIS_TTL'], **kwargs)
 
             return g
 
@@ -189,80 +303,100 @@ class RedisClient:
         obj = dittypes.DIResponse(typeList=[idt.type for idt in idts])
         idts_left = None
         try:
-            # 先从Redis拿数据
-            redis = await self.connect()
-            idts_left = []
-
+            # 先查进程内的LRU，剩下的key在一次MGET中从Redis读取
+            keys = []
+            local_items = []
             for idt in idts:
-                typ = idt.type
-                ids = idt.ids
-
-                version = self.get_di_version(typ)
-                key_prefix = f'{prefix}:{typ}:{version}'
-                keys = [f'{key_prefix}:{i}' for i in ids]
-                # 一次从多个key读取数据
-                items = await redis.mget(*keys)
-                logger.debug(f'[REDIS] Get {len(items)} DIResponse objs of {typ} from redis')
-
-                ids = [ids[i] for i, v in enumerate(items) if v is None]
-                items = [it for it in items if it is not None]
+                version = self.get_di_version(idt.type)
+                typ_locals = [self.di_local.get(f'{idt.type}:{version}:{i}') for i in idt.ids]
+                local_items.append(typ_locals)
+                keys.extend(f'{prefix}:{idt.type}:{version}:{i}' for i, v in zip(idt.ids, typ_locals) if v is None)
 
-                if len(ids) > 0:
-                    idts_left.append(dittypes.IdsWithType(ids=ids, type=typ))
+            hits = sum(len(idt.ids) for idt in idts) - len(keys)
+            metrics.incr('di_local:hit', hits)
+            metrics.incr('di_local:miss', len(keys))
 
-                vals = []
-                for item in items:
-                    if item is None:
-                        continue
-
-                    # 从Redis中的二进制数据恢复成所需结构
-                    creator = self.di_creator(typ)
-                    if creator is None:
-                        continue
-
-                    val = creator()
-                    mval = TMemoryBuffer(lz4.frame.decompress(item))
-                    cval = TCompactProtocol(mval)
-                    val.read(cval)
-                    vals.append(val)
+            items = []
+            if len(keys) > 0:
+                redis = await self.connect()
+                items = await self.call(redis.mget(*keys))
+                logger.debug(f'[REDIS] Get {len(items)} DIResponse objs from redis')
 
-                self.di_setlist(obj, typ, vals)
+            idts_left = []
+            pairs = []
+            found_ids = []
+            offset = 0
+            for idt, typ_locals in zip(idts, local_items):
+                typ = idt.type
+                ids = [i for i, v in zip(idt.ids, typ_locals) if v is None]
+                typ_items = items[offset:offset + len(ids)]
+                offset += len(ids)
+
+                ids_left = [ids[i] for i, v in enumerate(typ_items) if v is None]
+                if len(ids_left) > 0:
+                    idts_left.append(dittypes.IdsWithType(ids=ids_left, type=typ))
+
+                # ids DI did not return last time, shared by all workers
+                missing = [ids[i] for i, v in enumerate(typ_items) if v == MISSING]
+                if len(missing) > 0:
+                    metrics.incr('di_negative:redis_ids', len(missing))
+                    self.di_misses.add(typ, self.get_di_version(typ), missing)
+
+                di_type = self.di_type(typ)
+                if di_type is None or di_type.creator is None:
+                    continue
+
+                for i, it in zip(ids, typ_items):
+                    if it:
+                        pairs.append((di_type.creator, it))
+                        found_ids.append((typ, i))
+
+            # 从Redis中的二进制数据恢复成所需结构，所有类型一起解码
+            vals = await codec.decode(pairs)
+            decoded = {}
+            for (typ, i), val in zip(found_ids, vals):
+                decoded[(typ, i)] = val
+                self.di_local[f'{typ}:{self.get_di_version(typ)}:{i}'] = val
+
+            for idt, typ_locals in zip(idts, local_items):
+                typ_items = [v if v is not None else decoded.get((idt.type, i)) for i, v in zip(idt.ids, typ_locals)]
+                self.di_setlist(obj, idt.type, [it for it in typ_items if it is not None])
         except Exception as e:
             log.print_excp(e)
 
         return obj, idts_left
 
-    async def set_details_to_cache(self, obj_left, prefix):
+    async def set_details_to_cache(self, obj_left, prefix, idts_left):
         try:
-            redis = await self.connect(write=True)
-
-            pairs = []
-            keys = []
             types = obj_left.typeList
 
+            # 放入写队列，由后台批量写入Redis
             for typ in types:
                 version = self.get_di_version(typ)
                 key_prefix = f'{prefix}:{typ}:{version}'
                 items = self.di_getlist(obj_left, typ)
 
                 for it in items:
-                    key = f'{key_prefix}:{self.di_id(typ, it)}'
-                    mval = TMemoryBuffer()
-                    cval = TCompactProtocol(mval)
-                    it.write(cval)
-                    pairs.extend((key, lz4.frame.compress(mval.getvalue())))
-                    keys.append(key)
+                    id = self.di_id(typ, it)
+                    self.di_local[f'{typ}:{version}:{id}'] = it
+                    self.writer.set(f'{key_prefix}:{id}', it, DI_TTL)
 
-            # 一次性向Redis中存储多个数据
-            if len(pairs) > 0:
-                tr = redis.multi_exec()
-                tr.mset(*pairs)
+            if not self.di_misses.enabled:
+                return
 
-                for key in keys:
-                    tr.expire(key, DI_TTL)
+            # ids DI did not return are cached as missing for a short while
+            for idt in idts_left:
+                if idt.type not in types:
+                    continue
 
-                await tr.execute()
-                logger.debug(f'[REDIS] Set {len(items)} DIResponse objs of type:{typ} to redis')
+                version = self.get_di_version(idt.type)
+                returned = {self.di_id(idt.type, it) for it in self.di_getlist(obj_left, idt.type)}
+                missing = [i for i in idt.ids if i not in returned]
+                for i in missing:
+                    self.writer.set(f'{prefix}:{idt.type}:{version}:{i}', MISSING, self.di_misses.ttl)
+
+                self.di_misses.add(idt.type, version, missing)
+                metrics.incr('di_negative:stored', len(missing))
 
         except Exception as e:
             log.print_excp(e)
@@ -271,16 +405,24 @@ class RedisClient:
         prefix = 'di'
 
         def wrapper(f):
+            @wraps(f)
             async def g(*args, **kwargs):
                 is_group = idts_index is not None
                 idts = args[idts_index] if is_group else [
                     dittypes.IdsWithType(ids=[args[id_index]], type=args[type_index])]
+                requested = sum(len(idt.ids) for idt in idts)
+
+                # ids known to be missing are answered locally
+                idts = [dittypes.IdsWithType(type=idt.type, ids=self.di_misses.filter(
+                    idt.type, self.get_di_version(idt.type), idt.ids)) for idt in idts]
                 (obj, idts_left) = await self.get_details_from_cache(idts, prefix)
 
                 if idts_left is None:
-                    idts_left = idts
+                    idts_left = [idt for idt in idts if len(idt.ids) > 0]
 
                 if len(idts_left) <= 0:
+                    if sum(len(self.di_getlist(obj, idt.type)) for idt in idts) < requested:
+                        metrics.incr('di_negative:calls_avoided')
                     return obj
 
                 if is_group:
@@ -291,7 +433,7 @@ class RedisClient:
                 obj_left = await f(*args, **kwargs)
 
                 if obj_left is not None:
-                    await self.set_details_to_cache(obj_left, prefix)
+                    await self.set_details_to_cache(obj_left, prefix, idts_left)
                 else:
                     return obj
 
@@ -318,27 +460,40 @@ class RedisClient:
 
         return wrapper
 
-    def di_id(self, typ, item):
+    # typ -> DIType, built once from the resource classes
+    def build_di_types(self):
+        from models.v1.request_handler import REC_TYPE_TO_CLS_BASE
         from models.v1.resource.base_video import BaseVideo
-        api_cls = self.api_cls(typ)
-        if issubclass(api_cls, BaseVideo):
+
+        self._di_types = {typ: DIType(
+            creator=getattr(dittypes, api_cls.DI_CLS_NAME, None),
+            cls_name=api_cls.DI_CLS_NAME,
+            list_name=api_cls.DI_LIST_NAME,
+            is_video=issubclass(api_cls, BaseVideo)
+        ) for typ, api_cls in REC_TYPE_TO_CLS_BASE.items()}
+
+        return self._di_types
+
+    def di_type(self, typ):
+        di_types = self._di_types if self._di_types is not None else self.build_di_types()
+        return di_types.get(typ)
+
+    def di_id(self, typ, item):
+        di_type = self.di_type(typ)
+        if di_type is not None and di_type.is_video:
             res = item.BaseVideo.id
         else:
             res = item.id
 
         return res
 
-    def api_cls(self, typ):
-        from models.v1.request_handler import REC_TYPE_TO_CLS_BASE
-        return REC_TYPE_TO_CLS_BASE.get(typ)
-
     def di_list_name(self, typ):
-        api_cls = self.api_cls(typ)
-        return api_cls and api_cls.DI_LIST_NAME
+        di_type = self.di_type(typ)
+        return di_type and di_type.list_name
 
     def di_cls_name(self, typ):
-        api_cls = self.api_cls(typ)
-        return api_cls and api_cls.DI_CLS_NAME
+        di_type = self.di_type(typ)
+        return di_type and di_type.cls_name
 
     def di_getlist(self, di, typ):
         list_name = self.di_list_name(typ)
@@ -350,57 +505,48 @@ class RedisClient:
             setattr(di, list_name, items)
 
     def di_creator(self, typ):
-        cls_name = self.di_cls_name(typ)
-        return cls_name and getattr(dittypes, cls_name)
-
-    # def cache_related_card(self, interfaceName, id_index=-1):
-    #     capacity = 5
-    #     prefix = interfaceName
-    #     def wrapper(f):
-    #         async def g(*args, **kwargs):
-    #             service = args[0]
-    #             rid = args[id_index]
-    #             skey = f'{prefix}:{rid}'
-    #             obj = None
-
-    #             if service is None:
-    #                 # service is down, fetch from redis
-    #                 try:
-    #                     redis = await self.connect()
-    #                     robj = await redis.srandmember(skey)
-    #                     obj = recttypes.Response()
-    #                     mobj = TMemoryBuffer(robj)
-    #                     cobj = TCompactProtocol(mobj)
-    #                     obj.read(cobj)
-    #                     logger.debug(f'[REDIS] Get Response obj of {interfaceName}:{rid} from cache')
-    #                 except Exception as e:
-    #                     log.print_excp(e)
-    #             else:
-    #                 obj = await f(*args, **kwargs)
-    #                 if self.lucky() and obj is not None:
-    #                     try:
-    #                         redis = await self.connect(write=True)
-    #                         # del some randomly when too many
-    #                         total = await redis.scard(skey)
-    #                         if total > capacity:
-    #                             await redis.execute('spop', skey, int(total - capacity * 0.75))
-    #                         else:
-    #                             # save id to the redis set corresponding to interfaceName
-    #                             mobj = TMemoryBuffer()
-    #                             cobj = TCompactProtocol(mobj)
-    #                             obj.write(cobj)
-    #                             await redis.sadd(skey, mobj.getvalue())
-    #                             logger.debug(f'[REDIS] Set Response obj of {interfaceName}:{rid} to cache')
-
-    #                             # set ttl of skey
-    #                             await redis.expire(skey, RELATED_CARD_TTL)
-    #                     except Exception as e:
-    #                         log.print_excp(e)
-
-    #             return obj
-
-    #         return g
-    #     return wrapper
+        di_type = self.di_type(typ)
+        return di_type and di_type.creator
+
+
+class RedisL2:
+    '''second tier of a MemCache, shared by all workers'''
+
+    def __init__(self, client, creator, interfaceName, many=False):
+        self.client = client
+        self.creator = creator
+        self.interfaceName = interfaceName
+        self.many = many
+        self.ttl = getattr(conf, 'L2_TTL', {}).get(interfaceName, L2_TTL)
+
+    def key(self, mkey):
+        version = self.client.get_reco_version(self.creator, self.interfaceName)
+        return f'l2:{self.interfaceName}:{version}:' + ':'.join(str(k) for k in mkey)
+
+    async def get(self, mkey):
+        try:
+            redis = await self.client.connect()
+            robjs = await self.client.call(redis.lrange(self.key(mkey), 0, -1))
+            if not robjs:
+                return None
+
+            objs = await codec.decode_list(self.creator, robjs)
+            logger.debug(f'[REDIS] Get L2 of {self.interfaceName} from cache')
+            return objs if self.many else objs[0]
+        except Exception as e:
+            log.print_excp(e)
+
+        return None
+
+    async def set(self, mkey, value):
+        objs = value if self.many else [value]
+        if not objs:
+            return
+
+        try:
+            self.client.writer.replace_list(self.key(mkey), objs, self.ttl)
+        except Exception as e:
+            log.print_excp(e)
 
 
 redis = RedisClient()
@@ -0,0 +1,36 @@
+from hashlib import sha1
+
+
+class Script:
+    '''lua script called by its sha, loaded into redis by RedisClient.load_scripts'''
+
+    def __init__(self, source):
+        self.source = source
+        self.sha = sha1(source.encode()).hexdigest()
+
+
+# bounded sample set: add ARGV[3..] to the set KEYS[1], which keeps at most ARGV[1] members
+# by dropping random old ones first, and expires in ARGV[2] seconds
+BOUNDED_SET = Script('''
+redis.replicate_commands()
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local adding = #ARGV - 2
+local total = redis.call('SCARD', key)
+local drop = total + adding - capacity
+if drop > 0 then
+    if drop > total then
+        drop = total
+    end
+    redis.call('SPOP', key, drop)
+end
+redis.call('SADD', key, unpack(ARGV, 3))
+redis.call('EXPIRE', key, ARGV[2])
+return redis.call('SCARD', key)
+''')
+
+SCRIPTS = [BOUNDED_SET]
+
+
+def is_noscript(e):
+    return 'NOSCRIPT' in str(e)
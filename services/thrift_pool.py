@@ -0,0 +1,126 @@
+import asyncio
+from collections import deque
+from time import time
+from thrift import TTornado
+from utils import logger, metrics
+from . import thrift_protocol
+
+POOL_SIZE = 32
+MAX_IDLE = 60
+MAX_LIFETIME = 10 * 60
+
+
+class PooledConn:
+    def __init__(self, transport, client):
+        self.transport = transport
+        self.client = client
+        self.created = time()
+        self.last_used = self.created
+        self.broken = False
+
+    def healthy(self):
+        stream = self.transport.stream
+        if self.broken or stream is None or stream.closed():
+            return False
+
+        now = time()
+        return now - self.last_used < MAX_IDLE and now - self.created < MAX_LIFETIME
+
+    def close(self):
+        try:
+            self.transport.close()
+        except Exception:
+            pass
+
+
+class ThriftPool:
+    '''bounded pool of opened thrift connections of one service, checked out exclusively per call'''
+
+    def __init__(self, name, svc, client_cls):
+        self.name = name
+        self.host = svc['HOST']
+        self.port = svc['PORT']
+        self.maxsize = svc.get('POOL_SIZE', POOL_SIZE)
+        self.client_cls = client_cls
+        self._idle = deque()
+        self._waiters = deque()
+        self._size = 0
+
+        metrics.gauge(f'thrift_pool:{name}:size', lambda: self._size)
+        metrics.gauge(f'thrift_pool:{name}:idle', lambda: len(self._idle))
+        metrics.gauge(f'thrift_pool:{name}:waiting', lambda: len(self._waiters))
+
+    async def _connect(self, timeout=None):
+        transport = TTornado.TTornadoStreamTransport(self.host, self.port)
+        await transport.open(timeout)
+        metrics.incr(f'thrift_pool:{self.name}:connect')
+        return PooledConn(transport, self.client_cls(transport, thrift_protocol.factory()))
+
+    def _evict(self, conn):
+        self._size -= 1
+        conn.close()
+        metrics.incr(f'thrift_pool:{self.name}:evict')
+
+    def _wakeup(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def acquire(self, timeout=None):
+        start = time()
+        deadline = timeout and start + timeout
+
+        while True:
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.healthy():
+                    self._checkout(start)
+                    return conn
+
+                self._evict(conn)
+
+            if self._size < self.maxsize:
+                self._size += 1
+                try:
+                    conn = await self._connect(timeout)
+                except Exception:
+                    self._size -= 1
+                    self._wakeup()
+                    metrics.incr(f'thrift_pool:{self.name}:connect_error')
+                    raise
+
+                self._checkout(start)
+                return conn
+
+            # pool is exhausted, wait for a connection to be released
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, deadline and max(deadline - time(), 0))
+            except asyncio.TimeoutError:
+                metrics.incr(f'thrift_pool:{self.name}:wait_timeout')
+                raise Exception(f'{self.name} pool exhausted')
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+
+    def _checkout(self, start):
+        metrics.incr(f'thrift_pool:{self.name}:checkout')
+        metrics.observe(f'thrift_pool:{self.name}:wait', 1000 * (time() - start))
+
+    def release(self, conn):
+        conn.last_used = time()
+        if conn.healthy():
+            self._idle.append(conn)
+        else:
+            self._evict(conn)
+
+        self._wakeup()
+
+    def close(self):
+        while self._idle:
+            self._evict(self._idle.pop())
+
+        logger.info(f'{self.name} thrift pool closed')
@@ -0,0 +1,39 @@
+from conf import conf
+from utils import logger, metrics
+from thrift.protocol.TCompactProtocol import TCompactProtocol, TCompactProtocolFactory
+
+# the accelerated protocol writes the same bytes as TCompactProtocol, so both read what the other wrote
+try:
+    from thrift.protocol.TCompactProtocol import TCompactProtocolAccelerated, TCompactProtocolAcceleratedFactory
+except ImportError:
+    TCompactProtocolAccelerated = None
+    TCompactProtocolAcceleratedFactory = None
+
+try:
+    from thrift.protocol import fastbinary
+except ImportError:
+    fastbinary = None
+
+
+# the c extension is used only if thrift was built with it, THRIFT_ACCELERATED = False turns it off
+def is_accelerated():
+    return getattr(conf, 'THRIFT_ACCELERATED', True) and TCompactProtocolAccelerated is not None and fastbinary is not None
+
+
+ACCELERATED = is_accelerated()
+if ACCELERATED:
+    Protocol, ProtocolFactory = TCompactProtocolAccelerated, TCompactProtocolAcceleratedFactory
+else:
+    Protocol, ProtocolFactory = TCompactProtocol, TCompactProtocolFactory
+
+logger.info(f'Thrift compact protocol: {Protocol.__name__}')
+metrics.gauge('thrift:accelerated', lambda: int(ACCELERATED))
+
+
+# protocol on trans, the generated code falls back to python per call when trans is not a CReadableTransport
+def protocol(trans):
+    return Protocol(trans)
+
+
+def factory():
+    return ProtocolFactory()
@@ -0,0 +1,98 @@
+import asyncio
+import ujson
+from conf import conf
+from utils import logger, metrics, print_excp
+
+POLL_INTERVAL = 30
+RESUBSCRIBE_DELAY = 1
+
+DI = 'di'
+RECO = 'reco'
+KINDS = (DI, RECO)
+CHANNEL = 'versions'
+
+
+def hash_key(kind):
+    return f'versions:{kind}'
+
+
+class VersionRegistry:
+    '''cache key versions kept in redis hashes, pushed to every worker by pub/sub and polled as a fallback
+
+    di versions are per DI class name, reco versions per response type name or interface name;
+    a version only goes up, so a bump moves every worker to new keys and the old ones just expire
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self.poll_interval = getattr(conf, 'VERSIONS', {}).get('POLL_INTERVAL', POLL_INTERVAL)
+        self._tasks = []
+
+    def versions(self, kind):
+        return self.client.di_versions if kind == DI else self.client.reco_versions
+
+    def apply(self, kind, name, version):
+        versions = self.versions(kind)
+        current = versions.get(name, {}).get('version', 0)
+        if version <= current:
+            return
+
+        versions[name] = {'version': version}
+        metrics.incr(f'versions:{kind}:changed')
+        logger.info(f'[REDIS] {kind} version of {name}: {current} -> {version}')
+
+    async def load(self):
+        redis = await self.client.connect(write=True)
+        for kind in KINDS:
+            res = await redis.hgetall(hash_key(kind), encoding='utf-8')
+            for name, version in (res or {}).items():
+                self.apply(kind, name, int(version))
+
+    async def start(self):
+        await self.load()
+        self._tasks = [asyncio.ensure_future(self.poll()), asyncio.ensure_future(self.subscribe())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                metrics.incr('versions:poll_failed')
+                print_excp(e)
+
+    async def subscribe(self):
+        while True:
+            try:
+                redis = await self.client.connect(write=True)
+                channel, = await redis.subscribe(CHANNEL)
+                # messages may have been missed while not subscribed
+                await self.load()
+
+                while await channel.wait_message():
+                    msg = await channel.get_json()
+                    self.apply(msg['kind'], msg['name'], int(msg['version']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.incr('versions:subscribe_failed')
+                print_excp(e)
+
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    # called by operators, every worker switches to the new keys on the published message
+    async def bump(self, kind, name):
+        if kind not in KINDS:
+            raise ValueError(f'unknown version kind {kind}, not one of {KINDS}')
+
+        redis = await self.client.connect(write=True)
+        version = await redis.hincrby(hash_key(kind), name, 1)
+        await redis.publish(CHANNEL, ujson.dumps({'kind': kind, 'name': name, 'version': version}))
+        self.apply(kind, name, version)
+        metrics.incr(f'versions:{kind}:bumped')
+        return version
@@ -0,0 +1,159 @@
+import asyncio
+from collections import OrderedDict
+from conf import conf
+from utils import logger, metrics, deadline, print_excp
+from .redis_scripts import BOUNDED_SET, is_noscript
+from . import codec
+
+MAX_SIZE = 10000
+BATCH_SIZE = 200
+INTERVAL = 0.05
+FLUSH_TIMEOUT = 2
+
+SET = 'set'
+LIST = 'list'
+SET_ADD = 'sadd'
+
+
+class WriteBehind:
+    '''queue of redis cache writes, coalesced by key and flushed in pipelined batches off the request path
+
+    values are encoded when they are queued, so later changes of the shared objects never reach redis,
+    and compressed when they are flushed, the big batches off the event loop
+    '''
+
+    def __init__(self, client):
+        cfg = getattr(conf, 'WRITE_BEHIND', {})
+        self.client = client
+        self.max_size = cfg.get('MAX_SIZE', MAX_SIZE)
+        self.batch_size = cfg.get('BATCH_SIZE', BATCH_SIZE)
+        self.interval = cfg.get('INTERVAL', INTERVAL)
+        # (kind, key) -> op, a later write of the same key replaces the queued one
+        self._ops = OrderedDict()
+        self._wakeup = None
+        self._task = None
+
+        metrics.gauge('write_behind:queued', lambda: len(self._ops))
+
+    # SET key value EX ttl
+    def set(self, key, value, ttl):
+        self._put((SET, key), codec.encode(value), ttl)
+
+    # replace the whole list of key by values
+    def replace_list(self, key, values, ttl):
+        self._put((LIST, key), [codec.encode(value) for value in values], ttl)
+
+    # add value into a bounded sample set of at most capacity members, see redis_scripts.BOUNDED_SET
+    def add_to_set(self, key, value, ttl, capacity):
+        data = codec.encode(value)
+        op = self._ops.get((SET_ADD, key))
+        if op is not None:
+            op[0].add(data)
+            metrics.incr('write_behind:coalesced')
+            return
+
+        self._put((SET_ADD, key), {data}, ttl, capacity)
+
+    def _put(self, op_key, value, ttl, capacity=None):
+        if op_key in self._ops:
+            metrics.incr('write_behind:coalesced')
+        elif len(self._ops) >= self.max_size:
+            metrics.incr('write_behind:dropped')
+            return
+
+        self._ops[op_key] = (value, ttl, capacity)
+        metrics.incr('write_behind:enqueued')
+
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = deadline.detach(self._run())
+
+        # a full batch is flushed without waiting for the interval
+        if len(self._ops) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            while self._ops:
+                await self.flush()
+                if len(self._ops) < self.batch_size:
+                    break
+
+    def _take(self):
+        ops = []
+        while self._ops and len(ops) < self.batch_size:
+            ops.append(self._ops.popitem(last=False))
+
+        return ops
+
+    async def flush(self):
+        ops = self._take()
+        if len(ops) == 0:
+            return
+
+        try:
+            ops = await self._compress(ops)
+            redis = await self.client.connect(True)
+            try:
+                await self._execute(redis, ops)
+            except Exception as e:
+                if not is_noscript(e):
+                    raise
+
+                # redis lost its scripts (restart or failover), load them and try again
+                await self.client.load_scripts()
+                await self._execute(redis, ops)
+
+            metrics.incr('write_behind:flushed', len(ops))
+            logger.debug(f'[REDIS] Flushed {len(ops)} cache writes')
+        except Exception as e:
+            metrics.incr('write_behind:failed', len(ops))
+            print_excp(e)
+
+    # the values of all ops compressed as one batch
+    async def _compress(self, ops):
+        datas = []
+        for _, (value, ttl, capacity) in ops:
+            datas.extend(value if isinstance(value, (list, set)) else [value])
+
+        datas = iter(await codec.finish(datas))
+        res = []
+        for op_key, (value, ttl, capacity) in ops:
+            if isinstance(value, list):
+                value = [next(datas) for _ in value]
+            elif isinstance(value, set):
+                value = {next(datas) for _ in value}
+            else:
+                value = next(datas)
+            res.append((op_key, (value, ttl, capacity)))
+
+        return res
+
+    async def _execute(self, redis, ops):
+        # one MULTI/EXEC round trip, so a replaced list is never seen half written
+        tr = redis.multi_exec()
+        for (kind, key), (value, ttl, capacity) in ops:
+            if kind == SET:
+                tr.set(key, value, expire=ttl)
+            elif kind == LIST:
+                tr.delete(key)
+                tr.rpush(key, *value)
+                tr.expire(key, ttl)
+            elif kind == SET_ADD:
+                tr.evalsha(BOUNDED_SET.sha, keys=[key], args=[capacity, ttl, *value])
+
+        await asyncio.wait_for(tr.execute(), FLUSH_TIMEOUT)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        while self._ops:
+            await self.flush()
@@ -0,0 +1,54 @@
+'''cache_keys.normalize over a MemCache with the generated conf stubbed out'''
+import asyncio
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, *path))
+    m = importlib.util.module_from_spec(spec)
+    sys.modules[name] = m
+    spec.loader.exec_module(m)
+    return m
+
+
+@pytest.fixture
+def services(monkeypatch):
+    pytest.importorskip('ujson')
+    conf_mod = types.ModuleType('conf')
+    conf_mod.conf = load('conf_sample', 'conf', 'conf.sample.py').Conf
+    package = types.ModuleType('services')
+    package.__path__ = [os.path.join(ROOT, 'services')]
+    monkeypatch.setitem(sys.modules, 'conf', conf_mod)
+    monkeypatch.setitem(sys.modules, 'services', package)
+    for name in [n for n in sys.modules if n == 'utils' or n.startswith(('utils.', 'services.'))]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.syspath_prepend(ROOT)
+    return load('services.cache_keys', 'services', 'cache_keys.py'), load('services.mem_cache', 'services', 'mem_cache.py')
+
+
+def test_stats_count_the_memcache_keys(services):
+    cache_keys, mem_cache = services
+
+    # like the fetchers, the key leaves out user_id
+    @cache_keys.normalize(langList=cache_keys.dedupe, num=cache_keys.clamp())
+    @mem_cache.MemCache(16, -3, -1)
+    async def fetch_list(langList, user_id, num):
+        return num
+
+    async def run():
+        await fetch_list(['en', 'en'], 'u1', 7)
+        await fetch_list(['en'], 'u2', 10)
+        await fetch_list(['en'], 'u3', 9)
+
+    asyncio.run(run())
+    gauges = cache_keys.metrics.gauges
+    assert gauges['keys:fetch_list:raw_distinct']() == 3
+    assert gauges['keys:fetch_list:distinct']() == 1
+    assert gauges['keys:fetch_list:hit_ratio']() == 2 / 3
@@ -0,0 +1,90 @@
+'''MemCache with the generated conf stubbed out'''
+import asyncio
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, *path))
+    m = importlib.util.module_from_spec(spec)
+    sys.modules[name] = m
+    spec.loader.exec_module(m)
+    return m
+
+
+@pytest.fixture
+def mem_cache(monkeypatch):
+    conf_mod = types.ModuleType('conf')
+    conf_mod.conf = load('conf_sample', 'conf', 'conf.sample.py').Conf
+    services = types.ModuleType('services')
+    services.__path__ = [os.path.join(ROOT, 'services')]
+    monkeypatch.setitem(sys.modules, 'conf', conf_mod)
+    monkeypatch.setitem(sys.modules, 'services', services)
+    for name in [n for n in sys.modules if n == 'utils' or n.startswith(('utils.', 'services.'))]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.syspath_prepend(ROOT)
+    return load('services.mem_cache', 'services', 'mem_cache.py')
+
+
+def test_concurrent_stale_hits_refresh_once(mem_cache):
+    calls = []
+
+    @mem_cache.MemCache(16, 0, ttl=0.1, grace=1)
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        assert await fetch('k') == 1
+        await asyncio.sleep(0.15)
+        stale = await asyncio.gather(fetch('k'), fetch('k'))
+        await asyncio.sleep(0.05)
+        return stale, await fetch('k')
+
+    stale, fresh = asyncio.run(run())
+    assert stale == [1, 1]
+    assert fresh == 2
+    assert calls == ['k', 'k']
+
+
+def test_concurrent_misses_share_one_call(mem_cache):
+    calls = []
+
+    @mem_cache.MemCache(16, 0)
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key.upper()
+
+    async def run():
+        return await asyncio.gather(fetch('k'), fetch('k'), fetch('k'))
+
+    assert asyncio.run(run()) == ['K', 'K', 'K']
+    assert calls == ['k']
+
+
+def test_budget_forgets_evicted_and_expired_entries(mem_cache):
+    @mem_cache.MemCache(2, 0, ttl=0.05)
+    async def fetch(key):
+        return [key] * 10
+
+    account = mem_cache.budget.accounts[-1]
+
+    async def run():
+        for key in ('a', 'b', 'c'):
+            await fetch(key)
+        held = set(account.records)
+        await asyncio.sleep(0.1)
+        account.reconciled_at = 0
+        return held, account.current()
+
+    held, current = asyncio.run(run())
+    assert held == {('b',), ('c',)}
+    assert current.records == {} and current.bytes == 0
@@ -0,0 +1,104 @@
+'''the prefetch decorator with the generated conf stubbed out, on a function shaped like the card list fetchers:
+a client decorator injects the leading tclient, the cursor and card are found by name'''
+import asyncio
+import importlib.util
+import os
+import sys
+import types
+from functools import wraps
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, *path))
+    m = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(m)
+    return m
+
+
+@pytest.fixture
+def prefetch(monkeypatch):
+    conf = load('conf_sample', 'conf', 'conf.sample.py').Conf
+    monkeypatch.setattr(conf, 'PREFETCH', {'ENABLED': True})
+    conf_mod = types.ModuleType('conf')
+    conf_mod.conf = conf
+    monkeypatch.setitem(sys.modules, 'conf', conf_mod)
+    for name in [n for n in sys.modules if n == 'utils' or n.startswith('utils.')]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.syspath_prepend(ROOT)
+    return load('prefetch', 'services', 'prefetch.py')
+
+
+def client(f):
+    @wraps(f)
+    async def g(*args, **kwargs):
+        return await f(None, *args, **kwargs)
+    return g
+
+
+def fetcher(prefetch, calls, pages):
+    @prefetch.prefetch('next', 'card_id', lambda res: res.get('finalId'), type=1)
+    @client
+    async def fetch_list(tclient, lang, card_id, num, next, type, log_id=None):
+        calls.append((lang, card_id, num, next, type, log_id))
+        return pages.get(next, {})
+
+    return fetch_list
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_keyword_call_prefetches_next_page(prefetch):
+    calls = []
+    fetch_list = fetcher(prefetch, calls, {'': {'finalId': 'p2'}})
+
+    async def run():
+        await fetch_list('en', card_id='c1', num=10, next='', type=0, log_id='l1')
+        await settle()
+
+    asyncio.run(run())
+    assert calls == [('en', 'c1', 10, '', 0, 'l1'), ('en', 'c1', 10, 'p2', 1, 'l1')]
+    assert prefetch.prefetcher.pending == {('fetch_list', 'c1', 'p2'): True}
+
+
+def test_requested_prefetched_page_counts_as_used(prefetch):
+    calls = []
+    fetch_list = fetcher(prefetch, calls, {'': {'finalId': 'p2'}})
+
+    async def run():
+        await fetch_list('en', 'c1', 10, '', 0, log_id='l1')
+        await settle()
+        await fetch_list('en', 'c1', 10, 'p2', 1, log_id='l1')
+
+    asyncio.run(run())
+    assert calls[1] == ('en', 'c1', 10, 'p2', 1, 'l1')
+    assert prefetch.prefetcher.card_stats('fetch_list', 'c1').used == 1
+    assert prefetch.prefetcher.pending == {}
+
+
+def test_last_page_is_counted(prefetch):
+    calls = []
+    fetch_list = fetcher(prefetch, calls, {})
+
+    asyncio.run(fetch_list('en', 'c1', 10, '', 0))
+    assert len(calls) == 1
+    assert prefetch.metrics.counters['prefetch:fetch_list:no_cursor'] >= 1
+
+
+def test_disabled_does_not_prefetch(prefetch, monkeypatch):
+    monkeypatch.setattr(prefetch.conf, 'PREFETCH', {'ENABLED': False})
+    calls = []
+    fetch_list = fetcher(prefetch, calls, {'': {'finalId': 'p2'}})
+
+    async def run():
+        await fetch_list('en', card_id='c1', num=10, next='', type=0)
+        await settle()
+
+    asyncio.run(run())
+    assert calls == [('en', 'c1', 10, '', 0, None)]
@@ -0,0 +1,127 @@
+'''RelatedCardsBuilder.build with the generated conf, thrift and resource modules stubbed out
+
+the pagings stand in for the container pagings of the detail page, assuming what build relies on:
+Paging(req, card_id) with the class attribute CARD_ID (INTERFACE when it has none), render() and the
+lazy / lazy_params attributes the client reads to load a card later through CardPagingBuilder
+'''
+import asyncio
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESOURCES = ['ShortVideo', 'Publisher', 'MovieFilm', 'MusicVideo', 'MusicPlaylistQueue', 'MusicPlaylist', 'MusicAlbum',
+             'MusicAlbumQueue', 'MusicArtist', 'TvEpisode', 'TvSeason', 'TvShow', 'LiveChannel', 'LiveProgramme',
+             'LiveChannelPagingPrograms', 'BrowseCardItem', 'Game']
+SERVICES = ['fetch_di_detail_page_info', 'fetch_di_one_detail', 'get_history_multiple', 'get_watchlist_multiple',
+            'get_subscribe_multiple', 'get_thumb_multiple', 'get_history_single', 'get_watchlist_single',
+            'get_subscribe_single', 'get_thumb_single']
+
+
+def module(name, package=False, **attrs):
+    m = types.ModuleType(name)
+    if package:
+        m.__path__ = [os.path.join(ROOT, *name.split('.'))]
+    m.__dict__.update(attrs)
+    return m
+
+
+def sample_conf():
+    spec = importlib.util.spec_from_file_location('conf_sample', os.path.join(ROOT, 'conf', 'conf.sample.py'))
+    m = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(m)
+    return m.Conf
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    resources = {name: type(name, (), {'API_TYPE': name, 'RELATED_CARDS': []}) for name in RESOURCES}
+    enum = types.SimpleNamespace(VERSION_1065=1, VERSION_NEWEST=2, CARD_HISTORY='history', CARD_WATCHLIST='watchlist',
+                                 CARD_SUBSCRIBE='subscribe', CARD_THUMB='thumb', API_TO_REC={n: n for n in RESOURCES})
+    conf = sample_conf()
+    monkeypatch.setattr(conf, 'RELATED_CARDS_TIMEOUT', 0.05)
+
+    stubs = [
+        module('conf', package=True, conf=conf, enum=enum),
+        module('services', package=True, **{name: None for name in SERVICES}),
+        module('services.thrift', package=True),
+        module('services.thrift.di', package=True),
+        module('services.thrift.di.ttypes'),
+        module('models', package=True),
+        module('models.v1', package=True),
+        module('models.v1.resource', package=True, **resources),
+        module('models.v1.resource.live_tv', **resources),
+        module('models.v1.resource.browse_card', **resources),
+        module('models.v1.resource.game', **resources),
+        module('models.v1.request_body', RecResult=None),
+        module('models.v1.container', package=True),
+        module('models.v1.container.ua_card_paging', UaCardPaging=None),
+        module('models.v1.container.tab', package=True),
+        module('models.v1.container.tab.card_paging', TabCardPaging=None),
+    ]
+    for m in stubs:
+        monkeypatch.setitem(sys.modules, m.__name__, m)
+    for name in [n for n in sys.modules if n == 'utils' or n.startswith('utils.')]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.syspath_prepend(ROOT)
+
+    spec = importlib.util.spec_from_file_location('models.v1.request_handler',
+                                                  os.path.join(ROOT, 'models', 'v1', 'request_handler.py'))
+    request_handler = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, spec.name, request_handler)
+    spec.loader.exec_module(request_handler)
+    return request_handler, resources
+
+
+class Paging:
+    def __init__(self, req, card_id):
+        self.card_id = card_id
+        self.rendered = False
+
+    async def render(self):
+        self.rendered = True
+
+
+class FastPaging(Paging):
+    INTERFACE = 'fast'
+    CARD_ID = 'fast_card'
+
+
+class SlowPaging(Paging):
+    INTERFACE = 'slow'
+
+    async def render(self):
+        await asyncio.sleep(10)
+        self.rendered = True
+
+
+class FailingPaging(Paging):
+    INTERFACE = 'failing'
+
+    async def render(self):
+        raise RuntimeError('reco is down')
+
+
+REQ = {'xheaders': {'app-version': 0}}
+
+
+def test_slow_and_failing_cards_are_lazy(handler):
+    request_handler, resources = handler
+    resources['ShortVideo'].RELATED_CARDS = [FastPaging, SlowPaging, FailingPaging]
+
+    fast, slow, failing = asyncio.run(request_handler.RelatedCardsBuilder.build(REQ, 'ShortVideo'))
+
+    assert fast.card_id == 'fast_card' and fast.rendered and not fast.lazy
+    assert slow.card_id == 'slow' and not slow.rendered and slow.lazy
+    assert slow.lazy_params == {'relatedType': 'ShortVideo', 'interface': 'slow'}
+    assert failing.lazy
+    assert failing.lazy_params == {'relatedType': 'ShortVideo', 'interface': 'failing'}
+
+
+def test_unknown_type_has_no_cards(handler):
+    request_handler, _ = handler
+    assert asyncio.run(request_handler.RelatedCardsBuilder.build(REQ, 'Unknown')) == []
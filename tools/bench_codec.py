@@ -0,0 +1,112 @@
+'''encode/decode throughput of the redis cache codec, python vs accelerated thrift protocol
+
+    python -m tools.bench_codec [list items] [rounds]
+
+objects are recttypes.Response and every DI type, filled from their thrift_spec
+'''
+import sys
+from time import time
+import lz4.frame
+from thrift.Thrift import TType
+from thrift.transport.TTransport import TMemoryBuffer
+from thrift.protocol.TCompactProtocol import TCompactProtocol
+from services import thrift_protocol
+from services.thrift.recommend import ttypes as recttypes
+from services.redis_client import redis
+
+ITEMS = 20
+ROUNDS = 2000
+MAX_DEPTH = 4
+
+
+def fill_value(ttype, args, items, depth):
+    if ttype == TType.BOOL:
+        return True
+    if ttype in (TType.BYTE, TType.I16, TType.I32, TType.I64):
+        return 12345
+    if ttype == TType.DOUBLE:
+        return 1.5
+    if ttype == TType.STRING:
+        return 'abcdefghijklmnopqrstuvwxyz0123456789' if args == 'UTF8' else b'abcdefghijklmnopqrstuvwxyz0123456789'
+    if ttype == TType.STRUCT:
+        return fill(args[0], items, depth + 1)
+    if ttype in (TType.LIST, TType.SET):
+        values = [fill_value(args[0], args[1], items, depth + 1) for _ in range(items)]
+        return set(values) if ttype == TType.SET else values
+    if ttype == TType.MAP:
+        return {fill_value(args[0], args[1], items, depth + 1): fill_value(args[2], args[3], items, depth + 1)}
+
+
+# an instance of cls with every field set, containers of items elements
+def fill(cls, items=ITEMS, depth=0):
+    obj = cls()
+    if depth >= MAX_DEPTH:
+        return obj
+
+    for spec in cls.thrift_spec or []:
+        if spec is None:
+            continue
+
+        _, ttype, name, args, _ = spec
+        try:
+            setattr(obj, name, fill_value(ttype, args, items if depth == 0 else 2, depth))
+        except TypeError:
+            # unhashable set or map keys
+            pass
+
+    return obj
+
+
+def dumps(proto, obj):
+    mobj = TMemoryBuffer()
+    obj.write(proto(mobj))
+    return lz4.frame.compress(mobj.getvalue())
+
+
+def loads(proto, creator, data):
+    obj = creator()
+    obj.read(proto(TMemoryBuffer(lz4.frame.decompress(data))))
+    return obj
+
+
+def bench(name, creator, items, rounds):
+    obj = fill(creator, items)
+    data = dumps(TCompactProtocol, obj)
+
+    res = [f'{name:<24} {len(data):>8}B']
+    protos = [('python', TCompactProtocol)]
+    if thrift_protocol.ACCELERATED:
+        protos.append(('accelerated', thrift_protocol.Protocol))
+        # entries written by either protocol must stay readable by the other
+        assert dumps(thrift_protocol.Protocol, obj) == data
+        assert loads(thrift_protocol.Protocol, creator, data) == obj
+
+    for pname, proto in protos:
+        start = time()
+        for _ in range(rounds):
+            dumps(proto, obj)
+        encode = rounds / (time() - start)
+
+        start = time()
+        for _ in range(rounds):
+            loads(proto, creator, data)
+        decode = rounds / (time() - start)
+
+        res.append(f'{pname} enc {encode:>9.0f}/s dec {decode:>9.0f}/s')
+
+    print('  '.join(res))
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else ITEMS
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else ROUNDS
+
+    print(f'accelerated protocol available: {thrift_protocol.ACCELERATED}')
+    bench('Response', recttypes.Response, items, rounds)
+    for typ, di_type in sorted(redis.build_di_types().items()):
+        if di_type.creator is not None:
+            bench(di_type.cls_name, di_type.creator, items, rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+'''bump a cache key version, every worker switches to new keys at once
+
+    python -m tools.bump_version di <DI class name>
+    python -m tools.bump_version reco <response type name or interface name>
+'''
+import sys
+import asyncio
+from services.redis_client import redis
+
+
+async def bump(kind, name):
+    await redis.prepare_conn()
+    try:
+        version = await redis.registry.bump(kind, name)
+        print(f'{kind} version of {name} is now {version}')
+    finally:
+        await redis.close()
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+
+    asyncio.get_event_loop().run_until_complete(bump(sys.argv[1], sys.argv[2]))
+
+
+if __name__ == '__main__':
+    main()
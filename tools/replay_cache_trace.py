@@ -0,0 +1,54 @@
+'''hit ratio of MemCache's plain LRU vs TinyLFU admission on a replayed key trace
+
+    python -m tools.replay_cache_trace [trace file] [capacity]
+
+the trace file has one cache key per line (e.g. lang,tabId,num,nextToken from the access log);
+without it a synthetic trace is used: zipf distributed hot keys mixed with one-hit paging keys
+'''
+import sys
+from random import Random
+from itertools import count
+from cachetools import TTLCache
+from utils.tinylfu import TinyLFUCache
+
+CAPACITY = 1000
+TTL = 10 ** 9
+REQUESTS = 500000
+HOT_KEYS = 5000
+ONE_HIT_RATE = 0.5
+
+
+def synthetic_trace(requests=REQUESTS, hot_keys=HOT_KEYS, one_hit_rate=ONE_HIT_RATE, seed=1):
+    rnd = Random(seed)
+    weights = [1 / (i + 1) for i in range(hot_keys)]
+    hot = rnd.choices(range(hot_keys), weights, k=requests)
+    unique = count()
+    return [f'once:{next(unique)}' if rnd.random() < one_hit_rate else f'hot:{k}' for k in hot]
+
+
+def replay(cache, trace):
+    hits = 0
+    for key in trace:
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache[key] = True
+
+    return hits / len(trace)
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            trace = [line.strip() for line in f if line.strip()]
+    else:
+        trace = synthetic_trace()
+    capacity = int(sys.argv[2]) if len(sys.argv) > 2 else CAPACITY
+
+    print(f'{len(trace)} requests, {len(set(trace))} keys, capacity {capacity}')
+    print(f'lru     hit ratio {replay(TTLCache(capacity, TTL), trace):.4f}')
+    print(f'tinylfu hit ratio {replay(TinyLFUCache(capacity, TTL), trace):.4f}')
+
+
+if __name__ == '__main__':
+    main()
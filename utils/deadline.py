@@ -0,0 +1,60 @@
+import asyncio
+from contextvars import ContextVar
+from time import time
+from . import metrics
+from .log import print_excp
+
+# absolute deadline of the request being handled, set by routes.middleware.set_deadline
+_deadline = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def current():
+    return _deadline.get()
+
+
+def reset(deadline):
+    _deadline.set(deadline)
+
+
+def remaining():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time()
+
+
+def exceeded(stage):
+    left = remaining()
+    if left is not None and left <= 0:
+        metrics.incr(f'deadline:{stage}:exceeded')
+        return True
+
+    return False
+
+
+# the timeout a stage may use: the smaller of its own timeout and what is left of the request
+def budget(stage, timeout=None):
+    left = remaining()
+    if left is None:
+        return timeout
+
+    if left <= 0:
+        metrics.incr(f'deadline:{stage}:exceeded')
+        raise DeadlineExceeded(f'deadline exceeded before {stage}')
+
+    return left if timeout is None else min(timeout, left)
+
+
+async def _detached(cor):
+    reset(None)
+    try:
+        return await cor
+    except Exception as e:
+        print_excp(e)
+
+
+# run cor in the background, outside the deadline of the current request
+def detach(cor):
+    return asyncio.ensure_future(_detached(cor))
@@ -0,0 +1,16 @@
+from contextvars import ContextVar
+
+# set when a service call of the current task was answered by downgrade data instead of the service
+_downgraded = ContextVar('downgraded', default=False)
+
+
+def mark():
+    _downgraded.set(True)
+
+
+def clear():
+    _downgraded.set(False)
+
+
+def happened():
+    return _downgraded.get()
@@ -0,0 +1,14 @@
+import asyncio
+from . import metrics
+
+INTERVAL = 0.1
+
+
+# how late a sleep wakes up is how long the event loop was blocked
+async def monitor(interval=INTERVAL):
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - start - interval
+        metrics.observe('loop:lag', 1000 * max(lag, 0))
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+# 进程内的简单指标，通过 /metrics 查看
+counters = defaultdict(int)
+timers = {}
+gauges = {}
+
+
+def incr(name, n=1):
+    counters[name] += n
+
+
+def observe(name, ms):
+    t = timers.get(name)
+    if t is None:
+        t = timers[name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+    t['count'] += 1
+    t['total_ms'] += ms
+    if ms > t['max_ms']:
+        t['max_ms'] = ms
+
+
+# fn is called lazily when a snapshot is taken
+def gauge(name, fn):
+    gauges[name] = fn
+
+
+def snapshot():
+    res_gauges = {}
+    for name, fn in gauges.items():
+        try:
+            res_gauges[name] = fn()
+        except Exception:
+            res_gauges[name] = None
+
+    res_timers = {}
+    for name, t in timers.items():
+        res_timers[name] = {
+            **t,
+            'avg_ms': t['total_ms'] / t['count'] if t['count'] > 0 else 0
+        }
+
+    return {
+        'counters': dict(counters),
+        'timers': res_timers,
+        'gauges': res_gauges
+    }
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from time import time
+
+DEPTH = 4
+MAX_COUNT = 15
+# counters are halved after SAMPLE_FACTOR * capacity additions, so old popularity fades
+SAMPLE_FACTOR = 10
+WINDOW = 0.01
+
+_HALF = bytes(i >> 1 for i in range(256))
+
+
+class CountMinSketch:
+    '''approximate access frequency of keys, DEPTH rows of 4 bit style saturating counters'''
+
+    def __init__(self, capacity):
+        width = 1 << max(capacity - 1, 1).bit_length()
+        self._mask = width - 1
+        self._tables = [bytearray(width) for _ in range(DEPTH)]
+        self._additions = 0
+        self._sample = SAMPLE_FACTOR * capacity
+
+    def _indexes(self, key):
+        h = hash(key)
+        return [hash((h, i)) & self._mask for i in range(DEPTH)]
+
+    def add(self, key):
+        for table, i in zip(self._tables, self._indexes(key)):
+            if table[i] < MAX_COUNT:
+                table[i] += 1
+
+        self._additions += 1
+        if self._additions >= self._sample:
+            self._tables = [bytearray(table.translate(_HALF)) for table in self._tables]
+            self._additions //= 2
+
+    def estimate(self, key):
+        return min(table[i] for table, i in zip(self._tables, self._indexes(key)))
+
+
+class TinyLFUCache:
+    '''W-TinyLFU: new keys enter a small LRU window, and a key leaving the window
+    only enters the main LRU if it is used more often than the main victim,
+    so one-hit wonders do not push out hot entries
+
+    entries expire ttl seconds after they are set, like cachetools.TTLCache
+    '''
+
+    def __init__(self, maxsize, ttl, timer=time, window=WINDOW):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._window_size = max(int(maxsize * window), 1)
+        self._main_size = max(maxsize - self._window_size, 1)
+        self._window = OrderedDict()
+        self._main = OrderedDict()
+        self._sketch = CountMinSketch(maxsize)
+        self.rejected = 0
+        # called with each key the cache drops on its own, a rejected newcomer or an evicted main victim
+        self.on_evict = None
+
+    def __len__(self):
+        return len(self._window) + len(self._main)
+
+    def __contains__(self, key):
+        return key in self._window or key in self._main
+
+    # every lookup counts as an access of key
+    def get(self, key, default=None):
+        self._sketch.add(key)
+        for segment in (self._window, self._main):
+            item = segment.get(key)
+            if item is None:
+                continue
+
+            value, expire_at = item
+            if self.timer() >= expire_at:
+                del segment[key]
+                return default
+
+            segment.move_to_end(key)
+            return value
+
+        return default
+
+    def __setitem__(self, key, value):
+        item = (value, self.timer() + self.ttl)
+        for segment in (self._window, self._main):
+            if key in segment:
+                segment[key] = item
+                segment.move_to_end(key)
+                return
+
+        self._window[key] = item
+        if len(self._window) > self._window_size:
+            self._admit(*self._window.popitem(last=False))
+
+    def __delitem__(self, key):
+        if key in self._window:
+            del self._window[key]
+        else:
+            del self._main[key]
+
+    def _admit(self, key, item):
+        if len(self._main) < self._main_size:
+            self._main[key] = item
+            return
+
+        victim = next(iter(self._main))
+        expired = self.timer() >= self._main[victim][1]
+        if expired or self._sketch.estimate(key) > self._sketch.estimate(victim):
+            del self._main[victim]
+            self._main[key] = item
+            dropped = victim
+        else:
+            self.rejected += 1
+            dropped = key
+
+        if self.on_evict is not None:
+            self.on_evict(dropped)